@@ -76,6 +76,30 @@ def get_parser():
                            help="print a specific output file to the terminal", 
                            default=None, type=str)
 
+    # Score all pairs of containers for a plan
+    score = subparsers.add_parser("score",
+                                   help="Score tiles of container pairs for a plan.")
+
+    score.add_argument("outdir", nargs=1,
+                       help='output folder with a plan (see tree.score_pairs)', 
+                       type=str)
+
+    score.add_argument('--tiles', dest="tiles", 
+                       help="comma separated tile indices to score (default all)", 
+                       default=None, type=str)
+
+    score.add_argument('--workers', dest="workers", 
+                       help="number of processes to score tiles", 
+                       default=1, type=int)
+
+    score.add_argument('--merge', dest="merge", 
+                       help="merge the scores into a tiled heatmap when done.", 
+                       default=False, action='store_true')
+
+    score.add_argument('--jobs', dest="jobs", 
+                       help="write this many batch (SLURM) jobs instead of scoring", 
+                       default=None, type=int)
+
     return parser
 
 
@@ -136,6 +160,7 @@ def main():
     # Does the user want a shell?
     if args.command == "generate": from .generate import main
     elif args.command == "templates": from .templates import main
+    elif args.command == "score": from .score import main
 
     # Pass on to the correct parser
     return_code = 0
@@ -0,0 +1,48 @@
+#
+# Copyright (C) 2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from containertree.tree import PairwiseScores
+import sys
+import os
+
+
+def main(args):
+
+    outdir = args.outdir[0]
+    if not os.path.exists(os.path.join(outdir, 'plan.json')):
+        print('There is no scoring plan in %s, see tree.score_pairs' % outdir)
+        sys.exit(1)
+
+    scores = PairwiseScores(outdir)
+
+    # Write batch jobs (and don't score)
+    if args.jobs is not None:
+        scripts = scores.write_jobs(jobs=args.jobs)
+        print('Wrote %s jobs, submit with %s/jobs/run_jobs.sh' % (len(scripts), scores.outdir))
+        return
+
+    tiles = None
+    if args.tiles is not None:
+        tiles = [int(x) for x in args.tiles.split(',') if x]
+
+    scored = scores.run(tiles=tiles, workers=args.workers)
+    print('Scored %s tiles, %s are pending.' % (len(scored), len(scores.pending())))
+
+    if args.merge:
+        manifest = scores.merge()
+        if manifest is not None:
+            print('Merged scores to %s' % manifest)
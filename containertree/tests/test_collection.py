@@ -150,6 +150,275 @@ class TestCollection(unittest.TestCase):
         self.assertEqual(node, None)
 
 
+    def test_collection_tree_index(self):
+        '''test the node index and parent links'''
+        print("Testing collection tree index")
+        from containertree import CollectionTree
+
+        tree = CollectionTree()
+        tree.update('continuumio/miniconda3', 'library/debian')
+        tree.update('singularityhub/containertree', 'continuumio/miniconda3')
+        tree.update('childof/miniconda3', 'continuumio/miniconda3:1.0')
+
+        # Nodes are found in the index, with parent links
+        node = tree.find('singularityhub/containertree')
+        self.assertTrue(tree._index['singularityhub/containertree'] is node)
+        self.assertEqual(node._parent.name, 'continuumio/miniconda3')
+        self.assertEqual(node._parent_tag, 'latest')
+        self.assertTrue(tree.find('scratch') is tree.root)
+        self.assertEqual(tree.find('continuumio/miniconda3', tag='2.0'), None)
+
+        # Moving a node keeps the index
+        tree.update('continuumio/miniconda3', 'library/python')
+        self.assertTrue('/scratch/library/python/.latest/continuumio/miniconda3'
+                        '/.latest/singularityhub/containertree' in tree.get_paths())
+        self.assertEqual(tree.find('library/debian').children['latest'], [])
+
+        # Removing a tag removes its children from the index
+        tree.remove('continuumio/miniconda3', tag='1.0')
+        self.assertEqual(tree.find('childof/miniconda3'), None)
+
+        # A node is only removed under the node provided
+        debian = tree.find('library/debian')
+        self.assertEqual(tree.remove('continuumio/miniconda3', node=debian), None)
+        tree.remove('continuumio/miniconda3')
+        self.assertEqual(tree.find('singularityhub/containertree'), None)
+        self.assertEqual(sorted(tree._index), ['library/debian', 'library/python', 'scratch'])
+
+    def test_collection_tree_move(self):
+        '''test moving containers (and children) to a new parent'''
+        print("Testing collection tree moves")
+        from containertree import CollectionTree
+
+        tree = CollectionTree()
+        tree.update('continuumio/miniconda3', 'library/debian')
+        tree.update('singularityhub/containertree', 'continuumio/miniconda3')
+        count = tree.count
+
+        # Moving a container keeps its children and the count
+        tree.update('continuumio/miniconda3', 'library/python')
+        self.assertEqual(tree.count, count)
+        node = tree.find('singularityhub/containertree')
+        self.assertEqual(node._parent._parent.name, 'library/python')
+        self.assertEqual(tree.find('library/debian').children['latest'], [])
+
+        # A container moved under a parent that isn't in the tree leaves it
+        tree.update('continuumio/miniconda3', 'vanessa/base')
+        self.assertEqual(tree.find('continuumio/miniconda3'), None)
+        self.assertEqual(tree.find('singularityhub/containertree'), None)
+        self.assertEqual(tree.count, count - 1)
+
+        # A container can't be moved under its own child
+        tree.update('vanessa/pancakes', 'library/debian')
+        tree.update('library/debian', 'vanessa/pancakes')
+        self.assertEqual(tree.find('library/debian'), None)
+        self.assertEqual(tree.find('vanessa/pancakes'), None)
+        self.assertEqual(sorted(tree._index), ['library/python', 'scratch'])
+
+    def test_collection_tree_build(self):
+        '''test adding many pairs at once'''
+        print("Testing collection tree build")
+        from containertree import CollectionTree
+        from containertree.utils import get_installdir
+
+        dockerfile = os.path.join(get_installdir(), 'tests', 'Dockerfile')
+        pairs = [('singularityhub/containertree', 'continuumio/miniconda3'),
+                 ('childof/miniconda3', 'continuumio/miniconda3:1.0'),
+                 ('continuumio/miniconda3', 'library/python'),
+                 ('continuumio/miniconda3:1.0', 'library/python'),
+                 ('library/python', 'library/debian'),
+                 ('vanessa/sneeze', dockerfile),
+                 ('vanessa/salad', 'vanessa/sregistry'),
+                 ('vanessa/sregistry', 'vanessa/salad'),
+                 (dockerfile, 'library/ubuntu')]
+
+        tree = CollectionTree()
+        report = tree.build(pairs)
+        self.assertEqual(report['added'], 6)
+        self.assertEqual(report['invalid'], [(dockerfile, 'library/ubuntu')])
+        self.assertEqual(sorted(report['orphans']),
+                         [('vanessa/salad', 'vanessa/sregistry'),
+                          ('vanessa/sregistry', 'vanessa/salad')])
+
+        # Containers are added under their parents in one pass
+        paths = tree.get_paths()
+        self.assertTrue('/scratch/library/debian/.latest/library/python/.latest'
+                        '/continuumio/miniconda3/.1.0/childof/miniconda3' in paths)
+        self.assertTrue('/scratch/library/golang/.1.11.3-stretch/vanessa/sneeze' in paths)
+        self.assertEqual(len(tree.root.children), 2)
+
+    def test_collection_tree_ancestry(self):
+        '''test descendant and common ancestor queries'''
+        print("Testing collection tree ancestry")
+        from containertree import CollectionTree
+
+        tree = CollectionTree()
+        tree.update('continuumio/miniconda3', 'library/debian')
+        tree.update('singularityhub/containertree', 'continuumio/miniconda3')
+        tree.update('childof/miniconda3', 'continuumio/miniconda3:1.0')
+        tree.update('vanessa/pancakes', 'library/debian')
+
+        self.assertTrue(tree.is_descendant('childof/miniconda3', 'library/debian'))
+        self.assertTrue(tree.is_descendant('library/debian', 'scratch'))
+        self.assertFalse(tree.is_descendant('library/debian', 'library/debian'))
+        self.assertFalse(tree.is_descendant('vanessa/pancakes', 'continuumio/miniconda3'))
+        self.assertFalse(tree.is_descendant('vanessa/salad', 'library/debian'))
+        self.assertEqual(sorted(n.name for n in tree.descendants('continuumio/miniconda3')),
+                         ['childof/miniconda3', 'singularityhub/containertree'])
+
+        common = tree.common_ancestor(['singularityhub/containertree', 'childof/miniconda3'])
+        self.assertEqual(common.name, 'continuumio/miniconda3')
+        common = tree.common_ancestor(['childof/miniconda3', 'vanessa/pancakes'])
+        self.assertEqual(common.name, 'library/debian')
+        self.assertEqual(tree.common_ancestor(['library/debian', 'vanessa/salad']), None)
+
+        # The index is rebuilt after the tree changes
+        tree.update('continuumio/miniconda3', 'vanessa/pancakes')
+        self.assertTrue(tree.is_descendant('childof/miniconda3', 'vanessa/pancakes'))
+        tree.remove('continuumio/miniconda3')
+        self.assertEqual(tree.descendants('continuumio/miniconda3'), [])
+        self.assertEqual(len(tree.ancestry()), 3)
+
+    def test_collection_tree_descendant_counts(self):
+        '''test counts of containers built on each container'''
+        print("Testing collection tree descendant counts")
+        from containertree import CollectionTree
+
+        tree = CollectionTree()
+        tree.update('continuumio/miniconda3', 'library/debian')
+        tree.update('singularityhub/containertree', 'continuumio/miniconda3')
+        tree.update('childof/miniconda3', 'continuumio/miniconda3:1.0')
+        tree.update('vanessa/pancakes', 'library/debian:9')
+
+        self.assertEqual(tree.get_descendant_count('library/debian'), 4)
+        self.assertEqual(tree.get_descendant_count('library/debian', tag='latest'), 3)
+        self.assertEqual(tree.get_descendant_count('continuumio/miniconda3', tag='1.0'), 1)
+        self.assertEqual(tree.get_descendant_count('vanessa/salad'), 0)
+
+        top = tree.most_depended_on(2)
+        self.assertEqual([(node.name, count) for node, count in top],
+                         [('library/debian', 4), ('continuumio/miniconda3', 2)])
+        top = tree.most_depended_on(1, by_tag=True)
+        self.assertEqual([(node.name, tag, count) for node, tag, count in top],
+                         [('library/debian', 'latest', 3)])
+
+        # Counts are updated when containers move, or are removed
+        tree.update('continuumio/miniconda3', 'vanessa/pancakes')
+        self.assertEqual(tree.get_descendant_count('library/debian', tag='9'), 4)
+        self.assertEqual(tree.get_descendant_count('library/debian', tag='latest'), 0)
+        top = tree.most_depended_on(3)
+        self.assertEqual([(node.name, count) for node, count in top],
+                         [('library/debian', 4), ('vanessa/pancakes', 3),
+                          ('continuumio/miniconda3', 2)])
+        tree.remove('continuumio/miniconda3', tag='1.0')
+        self.assertEqual(tree.get_descendant_count('vanessa/pancakes'), 2)
+        top = tree.most_depended_on(3, by_tag=True)
+        self.assertEqual([(node.name, tag, count) for node, tag, count in top],
+                         [('library/debian', '9', 3), ('vanessa/pancakes', 'latest', 2),
+                          ('continuumio/miniconda3', 'latest', 1)])
+        tree.remove('continuumio/miniconda3')
+        self.assertEqual(tree.get_descendant_count('library/debian'), 1)
+        self.assertEqual(tree.root._descendants, 2)
+        top = tree.most_depended_on(3)
+        self.assertEqual([(node.name, count) for node, count in top],
+                         [('library/debian', 1)])
+
+    def test_collection_tree_descendant_counts_random(self):
+        '''test descendant counts against counting the subtree, for random
+           updates and removes
+        '''
+        print("Testing collection tree descendant counts, random changes")
+        from containertree import CollectionTree
+        import random
+
+        def count(node):
+            return sum(1 + count(child) for child in node.get_children())
+
+        names = ['library/base%s' % i for i in range(4)]
+        names += ['user%s/image%s' % (i, i) for i in range(20)]
+        rand = random.Random(2)
+
+        for trial in range(20):
+            tree = CollectionTree()
+            for step in range(100):
+                name = rand.choice(names)
+                action = rand.random()
+                if action < 0.85:
+                    parent = rand.choice(names + ['scratch'])
+                    if parent != name:
+                        if parent != 'scratch':
+                            parent = '%s:%s' % (parent, rand.choice(['1', 'latest']))
+                        tree.update('%s:%s' % (name, rand.choice(['1', '2', 'latest'])), parent)
+                elif action < 0.95 and tree.find(name) is not None:
+                    tree.remove(name)
+                elif tree.find(name) is not None and tree.find(name).children:
+                    tree.remove(name, tag=rand.choice(list(tree.find(name).children)))
+
+            # The root (scratch) has a list of children, not by tag
+            for node in list(tree._index.values()):
+                self.assertEqual(tree.get_descendant_count(node.name), count(node))
+                if node is tree.root:
+                    continue
+                for tag in node.children:
+                    expected = sum(1 + count(child) for child in node.children[tag])
+                    self.assertEqual(tree.get_descendant_count(node.name, tag=tag),
+                                     expected)
+
+            # The ranks are the counts of the nodes in the index
+            nodes = [node for node in tree._index.values() if node is not tree.root]
+            counts = sorted((count(node) for node in nodes), reverse=True)
+            top = tree.most_depended_on(5)
+            self.assertEqual([c for node, c in top], [c for c in counts if c > 0][:5])
+            for node, c in top:
+                self.assertTrue(tree._index[node.name] is node)
+                self.assertEqual(count(node), c)
+
+            counts = sorted((sum(1 + count(child) for child in node.children[tag])
+                             for node in nodes for tag in node.children), reverse=True)
+            top = tree.most_depended_on(len(tree._index) * 3, by_tag=True)
+            self.assertEqual([c for node, tag, c in top], [c for c in counts if c > 0])
+
+    def test_collection_tree_children(self):
+        '''test the children of a node, by tag'''
+        print("Testing collection tree children")
+        from containertree.tree.node import MultiNode
+        import pickle
+
+        node = MultiNode('library/debian', {'Name': 'library/debian'})
+        first, second, third = [MultiNode(name, {'Name': name}) for name in ['a/b', 'c/d', 'e/f']]
+        node.children['latest'] = []
+        node.children['9'] = [first]
+        node.children['latest'].append(second)
+        node.children['9'].append(third)
+
+        self.assertEqual(node.children, {'latest': [second], '9': [first, third]})
+        self.assertEqual(list(node.get_children()), [second, first, third])
+        self.assertEqual(node.children.keys(), ['latest', '9'])
+        self.assertTrue('9' in node.children and third in node.children['9'])
+        self.assertEqual(len(node.children['9']), 2)
+        self.assertEqual(node.children['9'][-1], third)
+
+        node.children['9'].remove(first)
+        self.assertEqual(node.children.pop('latest'), [second])
+        self.assertEqual([(tag, list(nodes)) for tag, nodes in node.children.items()],
+                         [('9', [third])])
+        with self.assertRaises(KeyError):
+            node.children['latest']
+
+        node = pickle.loads(pickle.dumps(node))
+        self.assertEqual(node.children['9'][0].name, 'e/f')
+
+        # Nodes with the same tags share them, until no node has them
+        from containertree.tree.node import _shared
+        import gc
+        other = MultiNode('library/alpine', {'Name': 'library/alpine'})
+        other.children['9'] = []
+        self.assertTrue(other.children._tags is node.children._tags)
+        self.assertTrue(('9',) in _shared)
+        del node, other
+        gc.collect()
+        self.assertFalse(('9',) in _shared)
+
     def test_collection_tree_fs(self):
         '''test collection filesystems'''
         print("Testing query and search functions")
@@ -177,6 +446,27 @@ class TestCollection(unittest.TestCase):
         paths = tree.paths(leaves_only=True)
         self.assertTrue('/scratch') not in paths
 
+        # Paths for labels, in order
+        paths = tree.get_paths(label=['singularityhub/singularity-cli',
+                                      'vanessa/salad', 'library/debian'])
+        self.assertEqual(paths, ['/scratch/library/debian/.latest/continuumio/'
+                                 'miniconda3/.1.0/singularityhub/singularity-cli',
+                                 '/scratch/library/debian'])
+        paths = tree.get_paths(label='continuumio/miniconda3', add_tags=False)
+        self.assertEqual(paths, ['/scratch/library/debian/continuumio/miniconda3'])
+        self.assertEqual(tree.get_paths(label='library/debian', leaves_only=True), [])
+
+        # Create the folders for the paths
+        created = tree.materialize(self.tmpdir, metadata='.metadata.json')
+        folders = [os.path.join(self.tmpdir, path.strip('/')) for path in tree.get_paths()]
+        self.assertTrue(all(os.path.isdir(folder) for folder in folders))
+        self.assertEqual(created, 12)
+        with open(os.path.join(folders[-1], '.metadata.json'), 'r') as filey:
+            self.assertTrue('name' in json.loads(filey.read()))
+
+        # Existing folders are kept, with threads
+        self.assertEqual(tree.materialize(self.tmpdir, workers=2), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -135,6 +135,490 @@ class TestContainer(unittest.TestCase):
         self.assertEqual(scores['diff'], 44185)
         self.assertEqual(scores['same'], 12201)
 
+    def test_tag_index(self):
+        '''test per container queries with the tag index'''
+        print("Testing tag index queries.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        for path in ['/etc', '/etc/ssl', '/etc/hosts', '/bin/bash']:
+            tree.insert(path, tag='container1')
+        for path in ['/etc', '/etc/hosts', '/usr/bin/python']:
+            tree.insert(path, tag='container2')
+
+        files = sorted([x.name for x in tree.files_of('container1')])
+        self.assertEqual(files, ['/bin/bash', '/etc', '/etc/hosts', '/etc/ssl'])
+
+        # Index is maintained after it's built
+        tree.insert('/etc/motd', tag='container1')
+        self.assertTrue('/etc/motd' in [x.name for x in tree.files_of('container1')])
+
+        diff = sorted([x.name for x in tree.diff('container1', 'container2')])
+        self.assertEqual(diff, ['/bin/bash', '/etc/motd', '/etc/ssl'])
+
+        shared = [x.name for x in tree.intersection(['container1', 'container2'])]
+        self.assertEqual(sorted(shared), ['/etc', '/etc/hosts'])
+
+        # Removed nodes are removed from the index
+        tree.remove('ssl')
+        files = [x.name for x in tree.files_of('container1')]
+        self.assertTrue('/etc/ssl' not in files)
+        self.assertTrue(tree.find('/etc') is not None)
+
+    def test_radix_tree(self):
+        '''test that a radix tree gives the same results as an expanded one'''
+        print("Testing radix (path compressed) tree.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        radix = ContainerFileTree(radix=True)
+
+        paths = ['/usr/share/doc/pkg/copyright',
+                 '/usr/share/doc/other/copyright',
+                 '/usr/share',
+                 '/etc/ssl/certs']
+        tree.data = radix.data = paths
+
+        for path in paths:
+            for t in [tree, radix]:
+                t.insert(path, {'Size': len(path)}, tag=path.split('/')[1])
+        radix.insert('/etc/hosts', tag='etc')
+        tree.insert('/etc/hosts', tag='etc')
+
+        # The chains are compressed
+        self.assertTrue(radix.count < tree.count)
+        node = radix.find('/etc/ssl/certs')
+        self.assertEqual(node.prefix, ['ssl'])
+
+        for path in paths:
+            found = tree.find(path)
+            if found is None:
+                self.assertEqual(radix.find(path), None)
+            else:
+                self.assertEqual(found.name, radix.find(path).name)
+        self.assertEqual(radix.find('/usr/share/doc/pkg/nope'), None)
+
+        # Searching returns the same components
+        for term in ['doc', 'copyright', '^s']:
+            self.assertEqual([x.label for x in tree.search(term)],
+                             [x.label for x in radix.search(term)])
+
+        self.assertEqual(tree.similarity_score(['usr', 'etc']),
+                         radix.similarity_score(['usr', 'etc']))
+
+        def keys(node):
+            return [node['key'], [keys(c) for c in node['children']]]
+        self.assertEqual(keys(tree.export_tree()), keys(radix.export_tree()))
+
+    def test_freeze_tree(self):
+        '''test that a frozen tree shares subtrees, and gives the same scores'''
+        print("Testing frozen (hash-consed) tree.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        conda = ['bin/python', 'bin/conda', 'lib/libz.so']
+        for tag, base in [('one', '/opt/conda'), ('two', '/srv/conda')]:
+            for path in conda:
+                tree.insert('%s/%s' % (base, path), {'Size': 1}, tag=tag)
+        tree.insert('/etc/hosts', tag='one')
+        tree.insert('/etc/hosts', tag='two')
+
+        frozen = tree.freeze()
+        self.assertEqual(frozen.count, tree.count)
+        self.assertTrue(frozen.unique < tree.count)
+
+        for tags in [['one', 'two'], ['one']]:
+            self.assertEqual(frozen.similarity_score(tags),
+                             tree.similarity_score(tags))
+
+        # Per tag queries are exact, even for shared subtrees
+        paths = sorted(frozen.paths('two'))
+        self.assertTrue('/srv/conda/bin/python' in paths)
+        self.assertTrue('/opt/conda/bin/python' not in paths)
+        node, tags = frozen.find('/opt/conda/lib')
+        self.assertEqual(tags, frozenset(['one']))
+        self.assertEqual(frozen.find('/opt/nope'), None)
+
+        # The same weights give the same scores, for an expanded or radix tree
+        trees = [tree, ContainerFileTree(radix=True)]
+        for tag, base in [('one', '/opt/conda'), ('two', '/srv/conda')]:
+            for path in conda:
+                trees[1].insert('%s/%s' % (base, path), {'Size': 1}, tag=tag)
+        trees[1].insert('/etc/hosts', tag='two')
+        for source in trees:
+            source.insert('/opt/conda/lib/big.so', {'Size': 100}, tag='one')
+            for path in conda:
+                source.insert('/home/me/conda/%s' % path, {'Size': 1}, tag='two')
+            frozen = source.freeze()
+            for weight in [None, 'size', 'depth', 'idf']:
+                for tags in [['one', 'two'], ['two']]:
+                    expected = source.similarity_score(tags, weight=weight)
+                    found = frozen.similarity_score(tags, weight=weight)
+                    for key in ['total', 'same', 'diff', 'score']:
+                        self.assertAlmostEqual(found[key], expected[key])
+        self.assertEqual(frozen.similarity_score(['one'], weight='nope'), None)
+
+    def test_subtree_hash_diff(self):
+        '''test Merkle subtree hashes, and diffing two trees'''
+        print("Testing subtree hashes and tree diff.")
+        from containertree import ContainerFileTree
+
+        paths = ['/etc', '/etc/hosts', '/etc/ssl/certs', '/usr/share/doc/copyright']
+        tree1 = ContainerFileTree()
+        tree2 = ContainerFileTree()
+        radix = ContainerFileTree(radix=True)
+        for path in paths:
+            for tree in [tree1, tree2, radix]:
+                tree.insert(path, {'Size': 10})
+
+        self.assertEqual(tree1.subtree_hash(), tree2.subtree_hash())
+        self.assertEqual(tree1.subtree_hash(), radix.subtree_hash())
+        self.assertEqual(list(tree1.diff(tree2)), [])
+
+        # Hashes are invalidated along the path on insert and remove
+        usr = tree2.subtree_hash(tree2.find('/usr/share/doc/copyright'))
+        tree2.insert('/etc/ssl/private', {'Size': 4})
+        tree2.remove('hosts')
+        self.assertNotEqual(tree1.subtree_hash(), tree2.subtree_hash())
+        self.assertEqual(usr, tree2.subtree_hash(tree2.find('/usr/share/doc/copyright')))
+
+        diff = sorted(tree1.diff(tree2))
+        self.assertEqual(diff, [('added', '/etc/ssl/private'),
+                                ('removed', '/etc/hosts')])
+
+        # A different size is a change
+        tree3 = ContainerFileTree()
+        for path in paths:
+            tree3.insert(path, {'Size': 20 if path == '/etc/hosts' else 10})
+        self.assertEqual(list(tree1.diff(tree3)), [('changed', '/etc/hosts')])
+
+        # Folders take the size of the file that created them, only a file changes
+        tree1 = ContainerFileTree()
+        tree1.insert('/usr/x', {'Size': 1})
+        tree3 = ContainerFileTree()
+        tree3.insert('/usr/x', {'Size': 2})
+        self.assertEqual(list(tree1.diff(tree3)), [('changed', '/usr/x')])
+        self.assertEqual(list(tree1.diff(tree3, leaves_only=False)),
+                         [('changed', '/usr'), ('changed', '/usr/x')])
+
+        # Radix trees that compress the same paths differently are aligned
+        radix1 = ContainerFileTree(radix=True)
+        radix1.insert('/usr/share/doc/x')
+        radix2 = ContainerFileTree(radix=True)
+        radix2.insert('/usr/share/doc/x')
+        radix2.insert('/usr/lib')
+        expanded = ContainerFileTree()
+        expanded.insert('/usr/share/doc/x')
+        self.assertEqual(list(radix1.diff(radix2)), [('added', '/usr/lib')])
+        self.assertEqual(list(radix2.diff(radix1)), [('removed', '/usr/lib')])
+        self.assertEqual(list(expanded.diff(radix2)), [('added', '/usr/lib')])
+        radix2.insert('/usr/share/man/y')
+        self.assertEqual(sorted(radix1.diff(radix2)), [('added', '/usr/lib'),
+                                                       ('added', '/usr/share/man'),
+                                                       ('added', '/usr/share/man/y')])
+
+    def test_rollup_du(self):
+        '''test subtree size rollups and du'''
+        print("Testing subtree size rollups.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        tree.rollup()
+        tree.insert('/opt', {'Size': 4096}, tag='one')
+        tree.insert('/opt/a.txt', {'Size': 10}, tag='one')
+        tree.insert('/opt/lib/b.so', {'Size': 100}, tag='one')
+        tree.insert('/opt/lib/b.so', {'Size': 100}, tag='two')
+        tree.insert('/etc/hosts', {'Size': 1}, tag='two')
+
+        usage = tree.du('/opt')
+        self.assertEqual(len(usage), 1)
+        self.assertEqual(usage[0]['size'], 110)
+        self.assertEqual(usage[0]['files'], 2)
+        self.assertEqual(usage[0]['tags'], {'one': 110, 'two': 100})
+        self.assertEqual(tree.du('/', tag='two')[0]['size'], 101)
+
+        usage = tree.du('/opt', depth=1)
+        self.assertEqual(sorted(x['path'] for x in usage),
+                         ['/opt', '/opt/a.txt', '/opt/lib'])
+
+        # Totals are updated on remove
+        tree.remove('lib')
+        self.assertEqual(tree.du('/')[0]['size'], 11)
+        self.assertEqual(tree.du('/nope'), [])
+
+    def test_top_k(self):
+        '''test top k queries for largest folders, files and shared paths'''
+        print("Testing top k queries.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        tree.insert('/opt/big/a.bin', {'Size': 500}, tag='one')
+        tree.insert('/opt/big/b.bin', {'Size': 300}, tag='one')
+        tree.insert('/opt/small/c.txt', {'Size': 5}, tag='one')
+        tree.insert('/etc/hosts', {'Size': 1}, tag='one')
+        tree.insert('/etc/hosts', {'Size': 1}, tag='two')
+
+        self.assertEqual(tree.top_k('size', 2), [(805, '/opt'), (800, '/opt/big')])
+        self.assertEqual(tree.top_k('file_size', 1), [(500, '/opt/big/a.bin')])
+        self.assertEqual(tree.top_k('tags', 1), [(2, '/etc/hosts')])
+        self.assertEqual(tree.top_k('size', 1, tag='two'), [(1, '/etc')])
+        self.assertEqual(tree.top_k('counter', 1), [(2, '/etc/hosts')])
+        self.assertEqual(tree.top_k('nope'), None)
+
+    def test_bloom_contains(self):
+        '''test path membership with per tag Bloom filters'''
+        print("Testing Bloom filter membership.")
+        from containertree import ContainerFileTree
+        import pickle
+
+        for radix in [False, True]:
+            tree = ContainerFileTree(radix=radix)
+            tree.insert('/usr/bin/python', tag='one')
+            tree.bloom()
+            tree.insert('/usr/lib/libc.so', tag='one')
+            tree.insert('/usr/lib/libc.so', tag='two')
+            tree.insert('/etc/hosts', tag='two')
+
+            self.assertTrue(tree.contains('one', '/usr/bin/python'))
+            self.assertTrue(tree.contains('one', '/usr/lib'))
+            self.assertTrue(tree.contains('two', '/usr/lib/libc.so'))
+            self.assertFalse(tree.contains('one', '/etc/hosts'))
+            self.assertFalse(tree.contains('two', '/usr/bin/python'))
+            self.assertFalse(tree.contains('nope', '/etc/hosts'))
+            self.assertEqual(tree.contains_any('two', ['/bin/sh', '/etc/hosts']),
+                             ['/etc/hosts'])
+
+            # The filters are saved with the tree
+            tree = pickle.loads(pickle.dumps(tree))
+            self.assertEqual(len(tree._bloom['one']), 5)
+            self.assertTrue(tree.contains('one', '/usr/lib/libc.so'))
+
+            # Removed paths are checked with the tree
+            tree.remove('libc.so')
+            self.assertFalse(tree.contains('one', '/usr/lib/libc.so'))
+
+        from containertree.tree.bloom import BloomFilter
+        filters = BloomFilter(error_rate=0.01, capacity=100)
+        for i in range(1000):
+            filters.add('/in/%s' % i)
+        self.assertEqual(len(filters.filters), 4)
+        self.assertTrue(all('/in/%s' % i in filters for i in range(1000)))
+        errors = sum('/out/%s' % i in filters for i in range(10000))
+        self.assertTrue(errors < 100)
+
+    def test_columns(self):
+        '''test the columnar view and vectorized aggregates'''
+        print("Testing columnar aggregates.")
+        from containertree import ContainerFileTree
+
+        for radix in [False, True]:
+            tree = ContainerFileTree(radix=radix)
+            tree.insert('/opt/a/x.bin', {'Size': 10}, tag='one')
+            tree.insert('/opt/a/y.bin', {'Size': 20}, tag='two')
+            tree.insert('/opt/b/c/z.bin', {'Size': 5}, tag='one')
+            tree.insert('/etc/hosts', {'Size': 1}, tag='two')
+
+            columns = tree.columns()
+            self.assertEqual(columns.parent[0], -1)
+            self.assertEqual(columns.aggregate('size', by='tag', path='/opt', leaf=True),
+                             {'one': 15.0, 'two': 20.0})
+            self.assertEqual(columns.aggregate('size', path='/opt/b', leaf=True), 5.0)
+            self.assertEqual(columns.aggregate('size', func='max', by='tag'),
+                             {'one': 10.0, 'two': 20.0})
+
+            # Tags without nodes in the mask are left out, for every function
+            for func in ['sum', 'count', 'mean', 'max', 'min']:
+                found = columns.aggregate('size', func=func, by='tag', path='/etc')
+                self.assertEqual(list(found), ['two'])
+            self.assertEqual(columns.aggregate('size', func='min', by='tag', leaf=True),
+                             {'one': 5.0, 'two': 1.0})
+            self.assertEqual(columns.aggregate('size', by='depth', leaf=True)[3], 30.0)
+            self.assertEqual(columns.aggregate('size', func='count', leaf=True), 4)
+            self.assertEqual(columns.aggregate('size', path='/nope'), None)
+            self.assertEqual(columns.aggregate('nope'), None)
+
+            # The view is rebuilt after the tree changes
+            tree.insert('/opt/new', {'Size': 100}, tag='two')
+            self.assertEqual(tree._columns, None)
+            self.assertEqual(tree.columns().aggregate('size', tag='two', leaf=True), 121.0)
+
+    def test_nearest(self):
+        '''test approximate nearest containers with MinHash / LSH'''
+        print("Testing nearest containers.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        files = ['/usr/lib/file%s' % i for i in range(50)]
+        for path in files:
+            tree.insert(path, tag='one')
+            tree.insert(path, tag='two')
+        for path in files[:40]:
+            tree.insert(path, tag='three')
+        tree.insert('/opt/other', tag='four')
+
+        nearest = tree.nearest('one', k=2)
+        self.assertEqual([tag for score, tag in nearest], ['two', 'three'])
+        self.assertEqual(nearest[0][0], 1.0)
+        self.assertEqual(tree.nearest('nope'), None)
+        self.assertEqual(tree.minhash(num_perm=10, bands=3), None)
+
+        check = tree.check_nearest(['one', 'three'], k=1)
+        self.assertEqual(check['recall'], 1.0)
+        self.assertTrue(check['error'] < 0.1)
+
+        # The index is rebuilt after the tree changes
+        tree.insert('/usr/lib/file0', tag='four')
+        self.assertEqual(tree._minhash, None)
+        self.assertTrue('four' in tree.minhash(bands=128).candidates('one'))
+
+    def test_weighted_similarity(self):
+        '''test weighted similarity scores, and the all pairs matrix'''
+        print("Testing weighted similarity.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        tree.insert('/usr/lib/cuda.so', {'Size': 2000}, tag='one')
+        tree.insert('/usr/lib/cuda.so', {'Size': 2000}, tag='two')
+        tree.insert('/etc/hostname', {'Size': 4}, tag='one')
+        tree.insert('/etc/hosts', {'Size': 4}, tag='two')
+        tree.insert('/etc/passwd', {'Size': 4}, tag='three')
+
+        tags = ['one', 'two']
+        self.assertEqual(tree.similarity_score(tags)['score'], 5 / 7)
+        self.assertEqual(tree.similarity_score(tags, weight='size')['score'], 2000 / 2008)
+        self.assertEqual(tree.similarity_score(tags, weight='nope'), None)
+
+        for weight in [None, 'size', 'depth', 'idf']:
+            scores, order = tree.similarity_matrix(weight=weight)
+            self.assertEqual(order, ['one', 'three', 'two'])
+            for i, tag1 in enumerate(order):
+                for j, tag2 in enumerate(order):
+                    score = tree.similarity_score([tag1, tag2], weight=weight)
+                    self.assertAlmostEqual(scores[i, j], score['score'])
+
+        scores, order = tree.similarity_matrix(tags=['two', 'one'])
+        self.assertEqual(scores.shape, (2, 2))
+        self.assertEqual(scores[0, 0], 1.0)
+
+    def test_cluster_heatmap(self):
+        '''test hierarchical clustering and export to the heatmap template'''
+        print("Testing clustering of containers.")
+        from containertree import ContainerFileTree
+
+        tree = ContainerFileTree()
+        for i in range(6):
+            group = ['/usr/lib', '/opt/data'][i % 2]
+            for j in range(10):
+                tree.insert('%s/file%s' % (group, j), tag='container%s' % i)
+            tree.insert('/etc/container%s' % i, tag='container%s' % i)
+
+        clusters = tree.cluster(block=2)
+        self.assertEqual(sorted(clusters['order']), clusters['tags'])
+        self.assertEqual(clusters['linkage'].shape, (5, 4))
+
+        # The two groups are next to each other
+        groups = [int(tag[-1]) % 2 for tag in clusters['order']]
+        self.assertTrue(groups in [sorted(groups), sorted(groups, reverse=True)])
+        self.assertEqual(tree.cluster(tags=['container0']), None)
+
+        filename = tree.export_heatmap(self.tmpdir, clusters=clusters, block=4)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'index.html')))
+        with open(filename, 'r') as filey:
+            lines = filey.read().strip().split('\n')
+        self.assertEqual(len(lines), 37)
+        self.assertEqual(lines[1].split('\t')[2:], ['1.0', '1', '1'])
+
+    def test_export_tiles(self):
+        '''test export of similarity scores as binary tiles'''
+        print("Testing tiled heatmap export.")
+        from containertree import ContainerFileTree
+        import numpy
+
+        tree = ContainerFileTree()
+        for i in range(7):
+            for j in range(i + 3):
+                tree.insert('/usr/lib/file%s' % j, tag='container%s' % i)
+
+        filename = tree.export_tiles(self.tmpdir, tile=3, overview=4)
+        with open(filename, 'r') as filey:
+            manifest = json.loads(filey.read())
+
+        self.assertEqual(manifest['count'], 7)
+        self.assertEqual(len(manifest['tiles']), 3)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'index.html')))
+
+        rows = [numpy.fromfile(os.path.join(self.tmpdir, name), dtype='<f4')
+                for name in manifest['tiles']]
+        scores = numpy.concatenate(rows).reshape(7, 7)
+        expected, tags = tree.similarity_matrix(tags=manifest['labels'])
+        self.assertTrue(numpy.allclose(scores, expected))
+
+        overview = numpy.fromfile(os.path.join(self.tmpdir, 'overview.f32'), dtype='<f4')
+        self.assertEqual(overview.shape, (16,))
+        self.assertAlmostEqual(overview.mean(), expected.mean(), places=1)
+
+    def test_score_pairs(self):
+        '''test tiled scoring of all pairs, with resume and merge'''
+        print("Testing tiled pairwise scores.")
+        from containertree import ContainerFileTree
+        from containertree.tree import PairwiseScores
+        import numpy
+
+        tree = ContainerFileTree()
+        for i in range(7):
+            for j in range(i + 3):
+                tree.insert('/usr/lib/file%s' % j, tag='container%s' % i)
+
+        outdir = os.path.join(self.tmpdir, 'scores')
+        scores = tree.score_pairs(outdir, tile=3, run=False)
+        self.assertEqual(len(scores.tiles), 6)
+        self.assertEqual(scores.run(tiles=[0, 1]), [0, 1])
+
+        # Resume from the plan in the folder, finished tiles are skipped
+        scores = PairwiseScores(outdir)
+        self.assertEqual(scores.done(), [0, 1])
+
+        # A plan is only resumed with the same tags, weight and tile
+        self.assertEqual(tree.score_pairs(outdir, tile=3, run=False).done(), [0, 1])
+        self.assertEqual(tree.score_pairs(outdir, tile=4, run=False), None)
+        self.assertEqual(tree.score_pairs(outdir, tile=3, weight='size',
+                                          run=False), None)
+        self.assertEqual(tree.score_pairs(outdir, tags=['container0', 'container1'],
+                                          tile=3, run=False), None)
+        self.assertEqual(scores.run(), [2, 3, 4, 5])
+        self.assertEqual(scores.pending(), [])
+
+        filename = scores.merge()
+        with open(filename, 'r') as filey:
+            manifest = json.loads(filey.read())
+        rows = [numpy.fromfile(os.path.join(os.path.dirname(filename), name), dtype='<f4')
+                for name in manifest['tiles']]
+        expected, tags = tree.similarity_matrix()
+        self.assertTrue(numpy.allclose(numpy.concatenate(rows).reshape(7, 7), expected))
+
+        scripts = scores.write_jobs(jobs=2)
+        self.assertEqual(len(scripts), 2)
+        with open(scripts[1], 'r') as filey:
+            self.assertTrue('score %s --tiles 1,3,5' % scores.outdir in filey.read())
+
+        # A plan is only resumed (or scored) for the same tree
+        from containertree.tree import scoring
+        import pickle
+        outdir = os.path.join(self.tmpdir, 'changed')
+        scores = tree.score_pairs(outdir, tile=3, run=False)
+        self.assertTrue(scores.check(tree))
+        tree.insert('/usr/lib/file0', tag='container6')
+        self.assertTrue(scores.check(tree))
+        tree.insert('/usr/lib/file9', tag='container6')
+        self.assertFalse(scores.check(tree))
+        self.assertEqual(tree.score_pairs(outdir, tile=3, run=False), None)
+
+        with open(scores.database, 'wb') as filey:
+            pickle.dump(tree, filey)
+        del scoring._workers[scores.outdir]
+        self.assertEqual(PairwiseScores(outdir).run(), [])
+        self.assertEqual(scores.done(), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -119,5 +119,95 @@ class TestPackages(unittest.TestCase):
         six = [x for x in df.columns.tolist() if x.startswith('six-')]
         self.assertTrue(len(six) == 1)
 
+    def test_export_sparse(self):
+        '''test sparse export of package vectors, without network'''
+        print("Testing sparse package export.")
+        from containertree.tree import ContainerAptTree
+
+        apt = ContainerAptTree()
+        apt._make_tree(data=[{'Name': 'wget', 'Version': '1.0'},
+                             {'Name': 'curl', 'Version': '7.0'}], tag='library/a')
+        apt._make_tree(data=[{'Name': 'wget', 'Version': '1.1'}], tag='library/b')
+        apt._make_tree(data=[{'Name': 'vim', 'Version': '8.0'}], tag='vanessa/c')
+
+        matrix, rows, columns = apt.export_sparse()
+        self.assertEqual(sorted(rows), ['library/a', 'library/b', 'vanessa/c'])
+        self.assertEqual(sorted(columns), ['curl', 'vim', 'wget'])
+        self.assertEqual(matrix.nnz, 4)
+
+        # The dense export has the same values
+        df = apt.export_vectors().fillna(0)
+        self.assertTrue((df.values == matrix.toarray()).all())
+        self.assertEqual(df.index.tolist(), rows)
+        self.assertEqual(df.columns.tolist(), columns)
+
+        # Unused columns are dropped with the filters
+        matrix, rows, columns = apt.export_sparse(regexp_tags="^library")
+        self.assertEqual(sorted(rows), ['library/a', 'library/b'])
+        self.assertTrue('vim' not in columns)
+
+        matrix, rows, columns = apt.export_sparse(include_versions=True,
+                                                  skip_tags=['library/a'])
+        self.assertEqual(sorted(columns), ['vim-v8.0', 'wget-v1.1'])
+
+        df = apt.export_sparse(include_tags=['library/b'], dataframe=True)
+        self.assertEqual(df.index.tolist(), ['library/b'])
+        self.assertEqual(df.columns.tolist(), ['wget'])
+
+    def test_package_versions(self):
+        '''test the package version index and range queries'''
+        print("Testing package version index.")
+        from containertree.tree import ContainerAptTree, ContainerPipTree
+
+        apt = ContainerAptTree()
+        versions = ['1.1.1-1ubuntu2.1~18.04.5', '1.0.2g-1ubuntu4',
+                    '1.1.1', '1.1.0g-2ubuntu4', '1:0.9.8']
+        for i, version in enumerate(versions):
+            apt._make_tree(data=[{'Name': 'openssl', 'Version': version}],
+                           tag='container%s' % i)
+
+        labels = [x.label for x in apt.versions_of('openssl')]
+        self.assertEqual(labels, ['1.0.2g-1ubuntu4', '1.1.0g-2ubuntu4', '1.1.1',
+                                  '1.1.1-1ubuntu2.1~18.04.5', '1:0.9.8'])
+
+        self.assertEqual(apt.containers_with('openssl', upper='1.1.1'),
+                         {'container1', 'container3'})
+        self.assertEqual(apt.containers_with('openssl', lower='1.1.1', upper='1.1.1',
+                                             include_upper=True), {'container2'})
+        self.assertEqual(apt.containers_with('wget'), set())
+
+        # The index is kept updated
+        apt._make_tree(data=[{'Name': 'openssl', 'Version': '1.0.1t-1'}], tag='new')
+        self.assertTrue('new' in apt.containers_with('openssl', upper='1.1.1'))
+        apt.remove('1.0.1t-1')
+        self.assertTrue('new' not in apt.containers_with('openssl'))
+
+        pip = ContainerPipTree()
+        for version in ['1.0', '1.0rc1', '1.0.post1', '0.9', '1.0.dev0']:
+            pip._make_tree(data=[{'Name': 'six', 'Version': version}], tag=version)
+        labels = [x.label for x in pip.versions_of('six', lower='0.9',
+                                                   include_lower=False)]
+        self.assertEqual(labels, ['1.0.dev0', '1.0rc1', '1.0', '1.0.post1'])
+
+    def test_package_tree_update(self):
+        '''test that nearest and columns see packages added after a query'''
+        print("Testing package tree updates after a query.")
+        from containertree.tree import ContainerAptTree
+
+        apt = ContainerAptTree()
+        packages = [{'Name': 'wget', 'Version': '1.0'},
+                    {'Name': 'curl', 'Version': '7.0'}]
+        apt._make_tree(data=packages, tag='library/a')
+        apt._make_tree(data=[{'Name': 'vim', 'Version': '8.0'}], tag='library/b')
+
+        self.assertEqual([tag for score, tag in apt.nearest('library/a')], [])
+        self.assertEqual(apt.columns().tags, ['library/a', 'library/b'])
+
+        apt._make_tree(data=packages, tag='library/c')
+        self.assertEqual(apt.nearest('library/a'), [(1.0, 'library/c')])
+        self.assertEqual(apt.columns().tags, ['library/a', 'library/b', 'library/c'])
+        self.assertEqual(apt.columns().aggregate('counter', func='count',
+                                                   tag='library/c'), 5)
+
 if __name__ == '__main__':
     unittest.main()
@@ -139,5 +139,79 @@ class TestUtils(unittest.TestCase):
         names = parse_image_uri("ubuntu@version")
         self.assertTrue(names['version'] == "version")
 
+        print('Testing utils.parse_image_uri.. cached, a copy for each call')
+        names = parse_image_uri("ubuntu")
+        self.assertEqual(names, parse_image_uri("ubuntu"))
+        names['version'] = "changed"
+        self.assertEqual(parse_image_uri("ubuntu")['version'], None)
+        self.assertEqual(parse_image_uri("ubuntu", default_tag="other")['repo_tag'], "other")
+
+        print('Testing utils.parse_image_uri.. least recently used are removed')
+        from containertree.utils import docker
+        size = docker._parsed_uris_size
+        docker._parsed_uris_size = 2
+        try:
+            docker._parsed_uris.clear()
+            parse_image_uri("ubuntu")
+            parse_image_uri("centos")
+            parse_image_uri("ubuntu")
+            parse_image_uri("debian")
+            keys = [key[0] for key in docker._parsed_uris]
+            self.assertEqual(keys, ["ubuntu", "debian"])
+        finally:
+            docker._parsed_uris_size = size
+
+        print('Testing utils.parse_image_uri.. fast path matches expressions')
+        from containertree.utils.docker import ( _split_image_uri,
+                                                 _match_image_uri )
+        for uri in ["ubuntu", "vanessa/salad:latest", "a_b/c-d:1.0",
+                    "registry.io/ubuntu", "localhost:5000/ubuntu", "a/b/c:d",
+                    "ubuntu:", "ubuntu:a:b", "/ubuntu", "ubuntu@version"]:
+            groups = _split_image_uri(uri)
+            if groups is not None:
+                self.assertEqual(groups, _match_image_uri(uri))
+        self.assertEqual(_split_image_uri("registry.io/ubuntu"), None)
+
+    def test_load_pairs(self):
+        print('Testing utils.load_pairs')
+        from containertree.utils import load_pairs, get_from
+
+        dockerfiles = {'ubuntu': '# base\n  FROM ubuntu:18.04 # pinned\nFROM debian\n',
+                       'build': 'FROM --platform=linux/amd64 golang AS build\n',
+                       'variable': 'FROM $BASE\n',
+                       'empty': 'RUN echo\n'}
+
+        pairs = []
+        for name, content in sorted(dockerfiles.items()):
+            dockerfile = os.path.join(self.tmpdir, name, 'Dockerfile')
+            os.mkdir(os.path.dirname(dockerfile))
+            with open(dockerfile, 'w') as filey:
+                filey.writelines(content)
+            pairs.append(('vanessa/%s' % name, dockerfile))
+
+        self.assertEqual(get_from(pairs[2][1]), 'ubuntu:18.04 # pinned')
+        self.assertEqual(get_from(pairs[1][1]), None)
+
+        pairs.append(('vanessa/salad', 'library/debian'))
+        pairs.append(('vanessa/missing', os.path.join(self.tmpdir, 'Dockerfile')))
+        expected = [None, None, ('vanessa/ubuntu', 'ubuntu:18.04'), None,
+                    ('vanessa/salad', 'library/debian'), None]
+        self.assertEqual(load_pairs(pairs), expected)
+        self.assertEqual(load_pairs(pairs, workers=2), expected)
+
+    def test_version_keys(self):
+        print('Testing utils.debian_version_key')
+        from containertree.utils import debian_version_key as key
+        self.assertTrue(key('1.0~rc1') < key('1.0') < key('1.0-1') < key('1.0.1'))
+        self.assertTrue(key('1.1.1') < key('1.1.1a') < key('1:0.9'))
+        self.assertEqual(key('1.0-0'), key('1.0'))
+
+        print('Testing utils.pep440_version_key')
+        from containertree.utils import pep440_version_key as key
+        self.assertTrue(key('1.0.dev0') < key('1.0a1') < key('1.0rc1') < key('1.0'))
+        self.assertTrue(key('1.0') < key('1.0+local') < key('1.0.post1') < key('1!0.1'))
+        self.assertEqual(key('1.0'), key('1.0.0'))
+        self.assertTrue(key('not-a-version') < key('0.1'))
+
 if __name__ == '__main__':
     unittest.main()
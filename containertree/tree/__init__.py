@@ -15,6 +15,8 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from .collection import CollectionTree
+from .frozen import FrozenTree
+from .scoring import PairwiseScores
 from .container import ( 
     ContainerTree, 
     ContainerFileTree,
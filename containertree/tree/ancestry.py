@@ -0,0 +1,196 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# An ancestry index for a CollectionTree. One (depth first) walk numbers the
+# nodes in the order they are entered (an Euler tour), and the nodes under a
+# node are the ones numbered after it, up to its exit number. Asking if one
+# container is built on another is then a comparison of numbers, and the
+# nearest common base of containers is found by jumping up the tree by
+# powers of two (binary lifting) instead of tracing paths from the root.
+
+
+class TreeAncestry(object):
+
+    def __init__(self, tree):
+        '''build the ancestry index for a collection tree, in one (depth
+           first) pass. Node i (in the order entered) has the nodes i + 1
+           up to (not including) exit[i] under it, and up[k][i] is the
+           ancestor 2**k levels above it (the root is its own parent).
+
+           nodes: the nodes, in the order they are entered
+           rows: the number (row) of each node, by name
+           depth: the depth of each node (the root is 0)
+           exit: the number after the last node under each node
+
+           Parameters
+           ==========
+           tree: the CollectionTree to index
+        '''
+        self.nodes = []
+        self.rows = {}
+        self.depth = []
+        parent = []
+
+        stack = [(tree.root, 0, 0)]
+        while stack:
+            node, up, level = stack.pop()
+            row = len(self.nodes)
+            self.rows[node.name] = row
+            self.nodes.append(node)
+            self.depth.append(level)
+            parent.append(up)
+            for child in reversed(list(node.get_children())):
+                stack.append((child, row, level + 1))
+
+        count = len(self.nodes)
+        size = [1] * count
+        for row in range(count - 1, 0, -1):
+            size[parent[row]] += size[row]
+        self.exit = [row + size[row] for row in range(count)]
+
+        # up[k][i] is the ancestor 2**k levels up, up to the root
+        self.up = [parent]
+        while (1 << len(self.up)) < max(self.depth) + 1:
+            last = self.up[-1]
+            self.up.append([last[last[row]] for row in range(count)])
+
+    def __str__(self):
+        return "TreeAncestry<%s>" % len(self.nodes)
+    def __repr__(self):
+        return "TreeAncestry<%s>" % len(self.nodes)
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def row(self, name):
+        '''return the row for a node (by name), or None if not in the tree'''
+        return self.rows.get(name)
+
+
+    def _is_ancestor(self, ancestor, row):
+        '''return True if row is ancestor, or under it'''
+        return ancestor <= row < self.exit[ancestor]
+
+
+    def is_descendant(self, name, ancestor):
+        '''return True if a node (name) is under another (ancestor), at any
+           depth. A node isn't a descendant of itself.
+
+           Parameters
+           ==========
+           name: the name of the node (e.g., vanessa/salad)
+           ancestor: the name of the ancestor (e.g., library/alpine)
+        '''
+        row = self.rows.get(name)
+        above = self.rows.get(ancestor)
+        if row is None or above is None:
+            return False
+        return row != above and self._is_ancestor(above, row)
+
+
+    def descendants(self, name):
+        '''return the nodes under a node (by name), at any depth, in depth
+           first order. An empty list is returned for a node that isn't
+           in the tree.
+        '''
+        row = self.rows.get(name)
+        if row is None:
+            return []
+        return self.nodes[row + 1:self.exit[row]]
+
+
+    def common_ancestor(self, names):
+        '''return the lowest node that all the nodes (by name) are under
+           (or are), or None if any of them aren't in the tree. For one
+           name the node itself is returned.
+
+           Parameters
+           ==========
+           names: a list of names (or one name)
+        '''
+        if not isinstance(names, (list, tuple, set)):
+            names = [names]
+
+        rows = [self.rows.get(name) for name in names]
+        if not rows or None in rows:
+            return None
+
+        found = rows[0]
+        for row in rows[1:]:
+            found = self._lowest(found, row)
+        return self.nodes[found]
+
+
+    def _lowest(self, first, second):
+        '''return the lowest common ancestor of two rows. We jump up from
+           the first row by powers of two, as long as we aren't above the
+           second, and the parent of where we stop is the ancestor.
+        '''
+        if self._is_ancestor(first, second):
+            return first
+        if self._is_ancestor(second, first):
+            return second
+
+        for up in reversed(self.up):
+            if not self._is_ancestor(up[first], second):
+                first = up[first]
+        return self.up[0][first]
+
+
+def ancestry(self):
+    '''return the ancestry index of the tree (see TreeAncestry) to check if
+       containers are built on others, list them, or find a common base.
+       The index is built the first time it's needed, and rebuilt after
+       the tree changes.
+    '''
+    if self._ancestry is None:
+        self._ancestry = TreeAncestry(self)
+    return self._ancestry
+
+
+def is_descendant(self, name, ancestor):
+    '''return True if a container (name, without a tag) is built on another
+       (ancestor), at any depth, e.g., is_descendant('vanessa/salad',
+       'library/alpine').
+
+       Parameters
+       ==========
+       name: the name of the container
+       ancestor: the name of the (base) container
+    '''
+    return self.ancestry().is_descendant(name, ancestor)
+
+
+def descendants(self, name):
+    '''return the nodes for all containers built on a container (name), at
+       any depth, without walking the tree.
+
+       Parameters
+       ==========
+       name: the name of the (base) container
+    '''
+    return self.ancestry().descendants(name)
+
+
+def common_ancestor(self, names):
+    '''return the node for the nearest container that all containers (a
+       list of names) are built on, or None if any aren't in the tree.
+
+       Parameters
+       ==========
+       names: a list of container names
+    '''
+    return self.ancestry().common_ancestor(names)
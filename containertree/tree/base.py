@@ -19,6 +19,8 @@ from random import choice
 import json
 import re
 from .node import Node
+from .frozen import FrozenTree
+from .topk import top_k
 from .loading import (
     load,
     update,
@@ -29,9 +31,44 @@ from .loading import (
     _load_json,
     _load_container_diff,
 )
+from .index import (
+    index_tags,
+    _unindex,
+    files_of,
+    _diff_tags,
+    intersection
+)
+from .merkle import (
+    _hash_component,
+    subtree_hash,
+    _component_hash,
+    diff,
+    _diff_trees
+)
+from .similarity import (
+    _similarity_weight,
+    _similarity_incidence,
+    _check_weight,
+    similarity_matrix
+)
+from .cluster import (
+    cluster,
+    export_heatmap,
+    export_tiles
+)
+from .scoring import score_pairs
+from .columns import columns
+from .minhash import (
+    minhash,
+    nearest,
+    check_nearest
+)
 
 class ContainerTreeBase(object):
 
+    # Attributes (aside from the label) that are part of subtree hashes
+    _hash_attributes = ('size', 'version')
+
     def __init__(self, inputs=None, tag=None, folder_sep='/'):
         '''construct a container tree from some export of files or 
            a string to indicate a container. This is determined by
@@ -56,6 +93,21 @@ class ContainerTreeBase(object):
 
         # Count the nodes
         self.count = 1
+
+        # An optional tag -> {node id: node} index, see index_tags
+        self._tag_index = None
+
+        # An optional MinHash / LSH index of the tags, see minhash
+        self._minhash = None
+
+        # An optional columnar (NumPy) view of the nodes, see columns
+        self._columns = None
+
+        # Keep subtree size totals (ContainerFileTree), see rollup
+        self._rollups = False
+
+        # Optional tag -> Bloom filter of paths (ContainerFileTree), see bloom
+        self._bloom = None
         
         # Sets self.data and builds self.tree
         if inputs != None:
@@ -85,7 +137,8 @@ class ContainerTreeBase(object):
 
 
     def add(self, name, node, attrs={}, tag=None):
-        '''add a node based on name to the tree, or return found node
+        '''add a node based on name to the tree, or return found node.
+           The caller updates the path (see _touch_path) when it's done.
         '''             
         # Do we have the package?    
         found = False
@@ -112,11 +165,19 @@ class ContainerTreeBase(object):
             node = new_node
 
         # Add the tag to the new (or existing) node
+        self._tag_node(node, tag)
+        return node
+
+
+    def _tag_node(self, node, tag):
+        '''add a tag to a node, and to the tag index if we are keeping one.
+           All tree builders should tag nodes through this function.
+        '''
         if tag is not None:
             if tag not in node.tags:
                 node.tags.add(tag)
-
-        return node
+                if self._tag_index is not None:
+                    self._tag_index.setdefault(tag, {})[id(node)] = node
 
 
     def _make_tree(self, data=None, tag=None):
@@ -124,6 +185,14 @@ class ContainerTreeBase(object):
         print('_make_tree must be instantiated by the subclass.')
 
 
+    def freeze(self):
+        '''return an immutable copy of the tree (a FrozenTree) where identical
+           subtrees are stored once. The frozen tree gives the same
+           similarity_score, and can list the paths for each tag.
+        '''
+        return FrozenTree(self)
+
+
     def export_tree(self, filename=None):
         '''export a data structure for a weighted, colored tree, either just
            the data or the full html / visualization. If filename is defined,
@@ -151,22 +220,26 @@ class ContainerTreeBase(object):
             if current is None:
                 current = self.root
 
-            tags = list(current.tags)
-            new_node = {'color': choice(colors),
-                        'key': current.label,
-                        'name': current.label.split('/')[-1],
-                        'tags': tags,
-                        'attrs': current.get_attributes(),
-                        'children': [] }
+            # A compressed (radix) node is exported as its chain of components
+            for link in current.get_chain():
+
+                tags = list(link.tags)
+                new_node = {'color': choice(colors),
+                            'key': link.label,
+                            'name': link.label.split('/')[-1],
+                            'tags': tags,
+                            'attrs': link.get_attributes(),
+                            'children': [] }
 
-            # Add the size if was provided!
-            if hasattr(current, 'size'):
-                new_node['size'] = current.size
+                # Add the size if was provided!
+                if hasattr(link, 'size'):
+                    new_node['size'] = link.size
 
-            if len(nodes) == 0:
-                nodes.update(new_node)
-            else:            
-                nodes['children'].append(new_node)
+                if len(nodes) == 0:
+                    nodes.update(new_node)
+                else:            
+                    nodes['children'].append(new_node)
+                nodes = new_node
 
             # Iterate through children, add to data structure
             for child in current.children:
@@ -188,7 +261,7 @@ class ContainerTreeBase(object):
 
 # Searching Functions
 
-    def similarity_score(self, tags):
+    def similarity_score(self, tags, weight=None):
         '''calculate a similarity score for one or more tags. The score is
            a basic information coefficient where we take into account:
  
@@ -197,26 +270,43 @@ class ContainerTreeBase(object):
            2/ the number of nodes where the tags are all present
            3/ the number of nodes where one or more tags are missing
 
+           By default each node counts once, or nodes can be weighted by
+           file size, inverse depth or idf (see _similarity_weight).
+
+           Parameters
+           ==========
+           tags: the tags (containers) to compare
+           weight: weight nodes by None (count), size, depth, or idf
         '''
+        if not _check_weight(weight):
+            return None
+
         total = 0       # total number of nodes with one or more
         intersect = 0   # all tags present at nodes
         diff = 0        # one or more tags missing
 
-        def traverse(tags, current, total, intersect, diff):
+        # The number of containers, for idf
+        count = len(self.root.tags)
+
+        def traverse(tags, current, total, intersect, diff, depth=0):
+
+            # A compressed (radix) node counts once per path component
+            node_weight = self._similarity_weight(current, weight, depth, count)
  
             # All tags are represented in the node
             if all(t in current.tags for t in tags):
-                intersect+=1
+                intersect+=node_weight
             else:
-                diff+=1
+                diff+=node_weight
 
             # If any of the tags are present, we add to total
             if any(t in current.tags for t in tags):
-                total+=1
+                total+=node_weight
 
             # Iterate through children, add to data structure
+            depth += len(current.prefix) + 1
             for child in current.children:
-                total,intersect,diff = traverse(tags, child, total, intersect, diff)
+                total,intersect,diff = traverse(tags, child, total, intersect, diff, depth)
 
             return total, intersect, diff
 
@@ -329,14 +419,58 @@ class ContainerTreeBase(object):
         if node.label == name:
             return node
 
-        # No children, we finished search
-        if len(node.children) > 0:
-            for c in range(len(node.children)):
-                child = node.children[c]
-                to_remove = self.remove(name, child)
-                if to_remove != None:
-                    del node.children[c]
-                    return to_remove
+        return self._remove(name, [node])
+
+
+    def _remove(self, name, path):
+        '''a helper to remove, to search the children of the last node in
+           path (the list of nodes from where we started) for the name.
+        '''
+        node = path[-1]
+
+        for c in range(len(node.children)):
+            child = node.children[c]
+
+            # Did we find the node?
+            if child.label == name:
+                del node.children[c]
+                self._touch_path(path, removed=child)
+                return child
+
+            path.append(child)
+            to_remove = self._remove(name, path)
+            path.pop()
+            if to_remove != None:
+                return to_remove
+
+
+    def _touch_path(self, path, tag=None, removed=None):
+        '''update anything we keep about the nodes in path (a list of nodes
+           from the root) after an insert along it, or after a child of the
+           last node was removed.
+
+           Parameters
+           ==========
+           path: the list of nodes, from the root, that were changed
+           tag: the tag that was added along the path
+           removed: a node (and children) removed from the last node in path
+        '''
+        for node in path:
+            node.invalidate()
+
+        # The MinHash signatures and columns are rebuilt when next needed
+        self._minhash = None
+        self._columns = None
+
+        if removed is not None:
+            self._unindex(removed)
+
+        if self._rollups:
+            self._rollup_path(path, tag, removed)
+
+        # Removed paths stay in the Bloom filters, contains checks the tree
+        if self._bloom is not None and tag is not None:
+            self._bloom_path(path, tag)
 
 
     def search(self, name, number=None, node=None):
@@ -380,3 +514,39 @@ ContainerTreeBase._load_http = _load_http
 ContainerTreeBase._load_json = _load_json
 ContainerTreeBase._load_list = _load_list
 ContainerTreeBase._load_container_diff = _load_container_diff
+
+# Tag Index Functions
+ContainerTreeBase.index_tags = index_tags
+ContainerTreeBase._unindex = _unindex
+ContainerTreeBase.files_of = files_of
+ContainerTreeBase._diff_tags = _diff_tags
+ContainerTreeBase.intersection = intersection
+
+# Merkle Hash Functions
+ContainerTreeBase._hash_component = _hash_component
+ContainerTreeBase.subtree_hash = subtree_hash
+ContainerTreeBase._component_hash = _component_hash
+ContainerTreeBase.diff = diff
+ContainerTreeBase._diff_trees = _diff_trees
+
+# Top-k Functions
+ContainerTreeBase.top_k = top_k
+
+# Columnar Functions
+ContainerTreeBase.columns = columns
+
+# MinHash Functions
+ContainerTreeBase.minhash = minhash
+ContainerTreeBase.nearest = nearest
+ContainerTreeBase.check_nearest = check_nearest
+
+# Similarity Functions
+ContainerTreeBase._similarity_weight = _similarity_weight
+ContainerTreeBase._similarity_incidence = _similarity_incidence
+ContainerTreeBase.similarity_matrix = similarity_matrix
+
+# Clustering Functions
+ContainerTreeBase.cluster = cluster
+ContainerTreeBase.export_heatmap = export_heatmap
+ContainerTreeBase.export_tiles = export_tiles
+ContainerTreeBase.score_pairs = score_pairs
@@ -0,0 +1,195 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Bloom filters for path membership in a ContainerFileTree. Each tag
+# (container) gets a filter of the paths that it has, so asking if a
+# container has a path is usually answered (no) without walking the tree.
+# A filter can say yes for a path that isn't there, so a yes is always
+# checked with the tree.
+
+from math import ceil, log
+import hashlib
+import struct
+
+
+class BloomFilter(object):
+
+    def __init__(self, error_rate=0.01, capacity=1024):
+        '''a (scalable) Bloom filter of strings. When the filter has capacity
+           strings, we add another filter with twice the capacity and half
+           the error rate, so the total error rate stays under error_rate
+           and the size grows with the number of strings.
+
+           Parameters
+           ==========
+           error_rate: the (maximum) rate of false positives
+           capacity: the number of strings for the first filter
+        '''
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.count = 0
+
+        # Each filter is [bits, number of bits, number of hashes, capacity, count]
+        self.filters = []
+        self._grow()
+
+    def __str__(self):
+        return "BloomFilter<%s>" % self.count
+    def __repr__(self):
+        return "BloomFilter<%s>" % self.count
+    def __len__(self):
+        return self.count
+
+
+    def _grow(self):
+        '''add a filter, with twice the capacity and half the error rate'''
+        level = len(self.filters)
+        capacity = self.capacity * 2 ** level
+        error_rate = self.error_rate * 0.5 ** (level + 1)
+
+        size = int(ceil(-capacity * log(error_rate) / log(2) ** 2))
+        hashes = max(1, int(round(size * log(2) / capacity)))
+        self.filters.append([bytearray((size + 7) // 8), size, hashes, capacity, 0])
+
+
+    def _hash(self, key):
+        '''return two 64 bit hashes of a string, for double hashing'''
+        digest = hashlib.sha1(key.encode('utf-8')).digest()
+        first, second = struct.unpack('<QQ', digest[:16])
+        return (first, second | 1)
+
+
+    def _positions(self, first, second, size, hashes):
+        return [(first + i * second) % size for i in range(hashes)]
+
+
+    def __contains__(self, key):
+        first, second = self._hash(key)
+        for bits, size, hashes, capacity, count in self.filters:
+            for position in self._positions(first, second, size, hashes):
+                if not bits[position >> 3] & (1 << (position & 7)):
+                    break
+            else:
+                return True
+        return False
+
+
+    def add(self, key):
+        '''add a string to the filter, and return False if it was (probably)
+           already there.
+        '''
+        if key in self:
+            return False
+
+        current = self.filters[-1]
+        if current[4] >= current[3]:
+            self._grow()
+            current = self.filters[-1]
+
+        bits, size, hashes = current[:3]
+        first, second = self._hash(key)
+        for position in self._positions(first, second, size, hashes):
+            bits[position >> 3] |= 1 << (position & 7)
+
+        current[4] += 1
+        self.count += 1
+        return True
+
+
+def bloom(self, error_rate=0.01, capacity=1024):
+    '''build a Bloom filter of paths for each tag, and keep them updated for
+       subsequent inserts. A path is added for every node that has the
+       tag (a file and its folders). The filters are kept with the tree,
+       so they are saved (and loaded) when the tree is pickled. Since
+       paths can't be taken out of a Bloom filter, removed paths stay in
+       the filters, and are caught by the check with the tree.
+
+       Parameters
+       ==========
+       error_rate: the (maximum) rate of false positives for each filter
+       capacity: the number of paths for the first filter of a tag
+    '''
+    self._bloom = {}
+    self._bloom_settings = (error_rate, capacity)
+
+    def traverse(node, path):
+        for segment in list(node.prefix) + [node.label]:
+            path = path + self.folder_sep + segment
+            for tag in node.tags:
+                self._bloom_filter(tag).add(path)
+
+        for child in node.children:
+            traverse(child, path)
+
+    for child in self.root.children:
+        traverse(child, '')
+
+    return self._bloom
+
+
+def _bloom_filter(self, tag):
+    '''return the Bloom filter for a tag, creating it if we don't have it'''
+    if tag not in self._bloom:
+        error_rate, capacity = self._bloom_settings
+        self._bloom[tag] = BloomFilter(error_rate, capacity)
+    return self._bloom[tag]
+
+
+def _bloom_path(self, path, tag):
+    '''add the paths for the nodes in path (a list of nodes from the root)
+       to the Bloom filter for the tag, after an insert.
+    '''
+    current = ''
+    filters = self._bloom_filter(tag)
+    for node in path[1:]:
+        for segment in list(node.prefix) + [node.label]:
+            current = current + self.folder_sep + segment
+            filters.add(current)
+
+
+def contains(self, tag, filepath):
+    '''return True if a tag (container) has a path (a file or folder). The
+       Bloom filter for the tag (see bloom) answers most negatives, and
+       otherwise we check the path in the tree.
+
+       Parameters
+       ==========
+       tag: the tag (container) to check
+       filepath: the path to look for
+    '''
+    components = self._split_path(filepath)
+
+    if self._bloom is not None and components:
+        if tag not in self._bloom:
+            return False
+        if self.folder_sep.join([''] + components) not in self._bloom[tag]:
+            return False
+
+    found = self._find_rollup(filepath)
+    return found is not None and tag in found[0].tags
+
+
+def contains_any(self, tag, filepaths):
+    '''return the paths (of a list) that a tag (container) has, for example
+       to check a container for any of a list of banned paths. An empty
+       list means the container has none of them.
+
+       Parameters
+       ==========
+       tag: the tag (container) to check
+       filepaths: a list of paths to look for
+    '''
+    return [filepath for filepath in filepaths if self.contains(tag, filepath)]
@@ -0,0 +1,217 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Hierarchical clustering of the containers (tags) in a tree, from the same
+# similarity scores as similarity_score, and exports of the scores for the
+# heatmap templates. The scores are calculated in blocks of rows, so the
+# memory needed (aside from the distances for the linkage) doesn't grow with
+# the square of the number of containers.
+
+from containertree.utils import get_template
+from .similarity import ( _check_weight, _similarity_block )
+import shutil
+import json
+import os
+
+
+def cluster(self, tags=None, weight=None, method='average', block=1024):
+    '''cluster the containers (tags) hierarchically, with a distance of
+       1 - similarity score. The distances are calculated for blocks of
+       rows at a time, straight into the condensed distance vector that
+       scipy.cluster.hierarchy.linkage uses. A dictionary is returned
+       with the tags, the linkage matrix (the dendrogram), the order of
+       the leaves, and the weight.
+
+       Parameters
+       ==========
+       tags: a list of tags to cluster (default is all tags in the tree)
+       weight: weight nodes by None (count), size, depth, or idf
+       method: the linkage method (average, complete, single, weighted)
+       block: the number of rows to calculate at once
+    '''
+    if not _check_weight(weight):
+        return None
+
+    from scipy.cluster.hierarchy import linkage, leaves_list
+    import numpy
+
+    if tags is None:
+        tags = sorted(self.root.tags)
+    tags = list(tags)
+
+    count = len(tags)
+    if count < 2:
+        print('At least two tags are needed to cluster.')
+        return None
+
+    incidence, weighted, totals = self._similarity_incidence(tags, weight)
+
+    # Row i of the upper triangle starts at i * n - i * (i + 1) / 2
+    distances = numpy.empty(count * (count - 1) // 2)
+    for start in range(0, count, block):
+        end = min(count, start + block)
+        scores = _similarity_block(incidence, weighted, totals,
+                                   (start, end), (start, count))
+        for i in range(start, end):
+            offset = i * count - i * (i + 1) // 2
+            row = scores[i - start, i - start + 1:]
+            distances[offset:offset + len(row)] = 1 - row
+
+    links = linkage(distances, method=method)
+    order = [tags[i] for i in leaves_list(links)]
+
+    return {'tags': tags,
+            'linkage': links,
+            'order': order,
+            'weight': weight}
+
+
+def export_heatmap(self, outdir, clusters=None, tags=None, weight=None,
+                                 block=1024):
+    '''export the similarity scores (in the order of a clustering) to the
+       data.tsv for the heatmap-large template, and copy the template to
+       index.html in the output folder. If clusters (from cluster) isn't
+       provided, we cluster the tags first. The scores are calculated and
+       written one block of rows at a time.
+
+       Parameters
+       ==========
+       outdir: the output folder to write data.tsv and index.html to
+       clusters: the result of cluster, to order the containers
+       tags: if clusters isn't provided, a list of tags to cluster
+       weight: if clusters isn't provided, weight nodes by None (count),
+               size, depth, or idf
+       block: the number of rows to calculate at once
+    '''
+    if clusters is None:
+        clusters = self.cluster(tags=tags, weight=weight, block=block)
+        if clusters is None:
+            return None
+
+    tags = clusters['order']
+    count = len(tags)
+    incidence, weighted, totals = self._similarity_incidence(tags, clusters['weight'])
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    filename = os.path.join(outdir, 'data.tsv')
+    with open(filename, 'w') as filey:
+        filey.writelines('container1\tcontainer2\tvalue\tx\ty\n')
+        for start in range(0, count, block):
+            end = min(count, start + block)
+            scores = _similarity_block(incidence, weighted, totals,
+                                       (start, end), (0, count))
+            for i in range(start, end):
+                row = scores[i - start]
+                filey.writelines('%s\t%s\t%s\t%s\t%s\n' % (tags[i], tags[j], row[j], i + 1, j + 1)
+                                 for j in range(count))
+
+    shutil.copyfile(get_template('heatmap-large'), os.path.join(outdir, 'index.html'))
+    return filename
+
+
+def export_tiles(self, outdir, clusters=None, tags=None, weight=None,
+                               tile=512, overview=512):
+    '''export the similarity scores as tiles of rows, each a binary file of
+       float32 (little endian, row major) with tile rows of all columns.
+       A manifest.json describes the labels and the tiles, and a smaller
+       overview (the mean of blocks of scores) is written for the whole
+       matrix. The heatmap-tiles template (copied to index.html) shows
+       the overview, and loads the tiles for the rows in view on demand.
+       The scores are calculated and written one tile at a time.
+
+       Parameters
+       ==========
+       outdir: the output folder to write the tiles and manifest to
+       clusters: the result of cluster, to order the containers
+       tags: if clusters isn't provided, a list of tags (default is all)
+       weight: if clusters isn't provided, weight nodes by None (count),
+               size, depth, or idf
+       tile: the number of rows in each tile
+       overview: the (maximum) number of rows and columns in the overview
+    '''
+    if clusters is not None:
+        tags = clusters['order']
+        weight = clusters['weight']
+    elif not _check_weight(weight):
+        return None
+
+    if tags is None:
+        tags = sorted(self.root.tags)
+    tags = list(tags)
+
+    count = len(tags)
+    incidence, weighted, totals = self._similarity_incidence(tags, weight)
+
+    def blocks():
+        for start in range(0, count, tile):
+            end = min(count, start + tile)
+            yield _similarity_block(incidence, weighted, totals,
+                                    (start, end), (0, count))
+
+    return _write_tiles(outdir, tags, blocks(), tile, overview, weight)
+
+
+def _write_tiles(outdir, labels, blocks, tile=512, overview=512, weight=None):
+    '''write the tiles, overview and manifest for export_tiles, where blocks
+       yields the scores for each tile of rows, in order (all with tile
+       rows, except the last).
+    '''
+    import numpy
+
+    count = len(labels)
+    tiles = os.path.join(outdir, 'tiles')
+    if not os.path.exists(tiles):
+        os.makedirs(tiles)
+
+    # Each row and column of the overview is the mean of a bin of scores
+    size = min(count, overview)
+    bins = numpy.arange(count) * size // count
+    starts = numpy.searchsorted(bins, numpy.arange(size))
+    sums = numpy.zeros((size, size))
+
+    files = []
+    for scores in blocks:
+        start = len(files) * tile
+        name = 'tiles/row-%s.f32' % len(files)
+        scores.astype('<f4').tofile(os.path.join(outdir, name))
+        files.append(name)
+
+        rows = bins[start:start + scores.shape[0]]
+        numpy.add.at(sums, rows, numpy.add.reduceat(scores, starts, axis=1))
+
+    sizes = numpy.bincount(bins, minlength=size)
+    sums /= sizes[:, None] * sizes[None, :]
+    sums.astype('<f4').tofile(os.path.join(outdir, 'overview.f32'))
+
+    manifest = {'count': count,
+                'labels': labels,
+                'tile': tile,
+                'tiles': files,
+                'dtype': 'float32',
+                'byteorder': 'little',
+                'weight': weight,
+                'overview': {'file': 'overview.f32',
+                             'size': size,
+                             'starts': starts.tolist()}}
+
+    filename = os.path.join(outdir, 'manifest.json')
+    with open(filename, 'w') as filey:
+        filey.writelines(json.dumps(manifest))
+
+    shutil.copyfile(get_template('heatmap-tiles'), os.path.join(outdir, 'index.html'))
+    return filename
@@ -15,18 +15,27 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
+from collections import deque
 from copy import deepcopy
 from random import choice
 from containertree.utils import (
     check_install, 
-    parse_image_uri
+    parse_image_uri,
+    load_pair,
+    load_pairs
 )
 from containertree.logger import bot
 import requests
 import json
-import re
 
 from .node import ( MultiNode, Node )
+from .ranking import Ranking
+from .ancestry import (
+    ancestry,
+    is_descendant,
+    descendants,
+    common_ancestor
+)
 from .loading import (
     _load_http,
     _load_list,
@@ -58,8 +67,15 @@ class CollectionTree(object):
         # Count the nodes
         self.count = 1
 
-        # Keep an index of all nodes
-        self._index = {'scratch': ''}     
+        # Keep an index of all nodes in the tree, by name
+        self._index = {'scratch': self.root}
+
+        # Rank the nodes in the index by descendant count (and by tag)
+        self._ranks = Ranking()
+        self._tag_ranks = Ranking()
+
+        # The ancestry index is built when needed (see ancestry)
+        self._ancestry = None
 
         # Sets self.data and builds self.tree
         if inputs != None:
@@ -79,78 +95,174 @@ class CollectionTree(object):
 
 
     def remove(self, name, node=None, tag=None):
-        '''find a path in the tree and remove (and return) the node if found.
-           The function returns None if the Node wasn't in the tree (and wasn't
-           found and removed). The way this is designed, we cannot remove the
-           root node (but we just return it). If a tag is not provided,
-           remove entire node with children tags.
+        '''find a container in the tree and remove (and return) the node if
+           found. The function returns None if the Node wasn't in the tree
+           (and wasn't found and removed). The way this is designed, we
+           cannot remove the root node. If a tag is not provided, remove
+           entire node with children tags. If node is provided, the container
+           is only removed if it's under the node. The container is looked up
+           in the index, and removed from its parent (using the parent link),
+           so we don't search the tree.
          '''
+        found = self._index.get(name)
+        if found is None or found is self.root:
+            return None
+
+        # If a node is provided, it must be an ancestor
+        if node is not None:
+            parent = found
+            while parent is not None and parent is not node:
+                parent = parent._parent
+            if parent is None:
+                return None
 
-        # Special case of first call, run function on root
-        if node == None:
-            node = self.root
-            return self.remove(name, node, tag)
+        # Case 1: we are given a tag, remove the tag (and children)
+        if tag != None:
+            if tag in found.children:
+                self._ancestry = None
+                count = (found._tag_descendants or {}).get(tag, 0)
+                self._count_descendants(found, -count, tag)
+                found._tag_descendants.pop(tag)
+                for child in found.children.pop(tag):
+                    child._parent = None
+                    self._unregister(child)
+
+        # Case 2: we delete the entire node (and all tags)
+        else:
+            self._remove_child(found)
+            self._unregister(found)
 
-        # Set removed node to None
-        removed = None
+        # Return the deleted node
+        self.count -= 1
+        return found
 
-        # Iterate through children, and look for name
-        # The top level of the tree doesn't have tags
-        if isinstance(node.children, list):
-            for child in node.children:
 
-                # Did we find the node?
-                if child.label == name:
+    def _add_child(self, parent, child, tag=None):
+        '''add a child to a parent (under a tag, unless the parent is the
+           root), set the parent link, and add the child (and the nodes
+           under it) to the descendant counts of the parent and its
+           ancestors. The index isn't updated (see _register).
+        '''
+        if isinstance(parent.children, list):
+            parent.children.append(child)
+        else:
+            parent.children._append(tag, child)
 
-                    # Case 1: we are given a tag
-                    if tag != None:
-                        if tag in child.children:
-                            del child.children[tag]
+        child._parent = parent
+        child._parent_tag = tag
+        self._ancestry = None
+        self._count_descendants(parent, child._descendants + 1, tag, child)
 
-                    # Case 2: we delete the entire node (and all tags)
-                    else:
-                        node.children = [c for c in node.children if c != child]
 
-                    # Return the deleted node
-                    self.count -= 1
-                    return child
-                
-                # If we don't find the node, look for it in child
-                removed = self.remove(name, child, tag)
-                if removed != None:
-                    return removed
+    def _remove_child(self, child):
+        '''remove a child from its parent, using the parent link, and take
+           it out of the descendant counts. The index isn't updated (see
+           _unregister).
+        '''
+        parent = child._parent
+        if parent is not None:
+            self._count_descendants(parent, -child._descendants - 1,
+                                    child._parent_tag, child)
+            if isinstance(parent.children, list):
+                parent.children.remove(child)
+            else:
+                parent.children._remove(child._parent_tag, child)
+            self._ancestry = None
 
-        # All other nodes have dictionaries
-        else:
+        child._parent = None
+        child._parent_tag = None
 
-            for child_tag, children in node.children.items():
 
-                for child in children:
+    def _is_child(self, parent, child, tag=None):
+        '''return True if a node is a child of a parent (under a tag), from
+           the parent link, instead of looking in the children.
+        '''
+        return child._parent is parent and child._parent_tag == tag
 
-                    # Did we find the node?
-                    if child.label == name:
 
-                        # Case 1: we are given a tag
-                        if tag != None:
-                            if tag in child.children:
-                                del child.children[tag]
+    def _count_descendants(self, node, count, tag=None, stop=None):
+        '''add a count to the descendants of a node (and under a tag, for a
+           MultiNode) and then of each of its ancestors, up the parent
+           links. This takes time proportional to the depth of the node.
+           If stop is an ancestor (a node added under its own child) we
+           stop there, since the nodes aren't in the tree. The ranks are
+           updated for nodes in the index.
+        '''
+        while node is not None and node is not stop:
+            node._descendants += count
+            if tag is not None:
+                if node._tag_descendants is None:
+                    node._tag_descendants = {}
+                node._tag_descendants[tag] = node._tag_descendants.get(tag, 0) + count
 
-                        # Case 2: we delete the entire node (and all tags) from list
-                        else: 
-                            childs = node.children[child_tag]
-                            childs = [c for c in childs if c != child]
-                            node.children[child_tag] = childs
+            if node is not self.root and self._index.get(node.name) is node:
+                self._ranks.set(node.name, node._descendants)
+                if tag is not None:
+                    self._tag_ranks.set((node.name, tag), node._tag_descendants[tag])
 
-                        # Return the deleted node
-                        self.count -= 1
-                        return child
-                  
-                    # If we don't find the node, look for it in child
-                    removed = self.remove(name, child, tag)
-                    if removed != None:
-                        return removed
+            tag = node._parent_tag
+            node = node._parent
 
-        return removed
+
+    def _rank(self, node):
+        '''add the descendant counts of a node (that was added to the index)
+           to the ranks. The root isn't ranked.
+        '''
+        if node is not self.root:
+            self._ranks.set(node.name, node._descendants)
+            for tag, count in (node._tag_descendants or {}).items():
+                self._tag_ranks.set((node.name, tag), count)
+
+
+    def _unrank(self, node):
+        '''remove a node (that was removed from the index) from the ranks'''
+        self._ranks.discard(node.name)
+        for tag in (node._tag_descendants or {}):
+            self._tag_ranks.discard((node.name, tag))
+
+
+    def _in_tree(self, node):
+        '''return True if a node is connected to the root by parent links.
+           This takes time proportional to the depth of the node.
+        '''
+        parent = node._parent
+        while parent is not None:
+            if parent is self.root:
+                return True
+
+            # A node added under its own child isn't in the tree
+            if parent is node:
+                return False
+            parent = parent._parent
+        return node is self.root
+
+
+    def _register(self, node):
+        '''add a node and its children to the index (and the ranks)'''
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            previous = self._index.get(node.name)
+            if previous is not None and previous is not node:
+                self._unrank(previous)
+            self._index[node.name] = node
+            self._rank(node)
+            nodes.extend(node.get_children())
+
+
+    def _unregister(self, node):
+        '''remove a node and its children from the index (and the ranks).
+           A node that was added under its own child (see _in_tree) isn't
+           visited twice.
+        '''
+        start = node
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            if self._index.get(node.name) is node:
+                del self._index[node.name]
+                self._unrank(node)
+            nodes.extend(c for c in node.get_children() if c is not start)
 
 
 # Searching Functions
@@ -161,14 +273,12 @@ class CollectionTree(object):
            on themselves (e.g., not filepaths or words). If the user
            specifies a tag, return the node only if the tag is included.
            For addition of a new tag to a node, leave the tag blank to
-           return the general collection node (and then add it)
+           return the general collection node (and then add it). From
+           the root, this is a lookup in the index of nodes.
         '''
         # Only do index search if started from root
         if node == None:
-            node = self.root
-            found = self._find(name, tag, node)
-            if found != None:
-                return found
+            return self._find(name, tag)
 
         # Did we find the node?
         if node.label == name:
@@ -192,30 +302,13 @@ class CollectionTree(object):
                 return found_node
 
 
-    def _find(self, name, tag, node):
-        '''a helper to find that tries finding with the index first.
+    def _find(self, name, tag=None):
+        '''a helper to find a node (with a tag, if defined) in the index.
         '''
-        found = None
-
-        # Otherwise, check the index for the node
-        if name in self._index:
-            lookup = self._index[name].split('|')
-
-            # Pop the root node
-            lookup.pop(0)
-            children = self.root.children
-
-            while lookup:
-                childname = lookup.pop(0)
-                childtag = lookup.pop(0)
-
-                node = [x for x in children if x.name == childname][0]
-                children = node.children[childtag]
- 
-            for found in children:
-                if found.name == name:
-                    return found               
-
+        found = self._index.get(name)
+        if found is not None and tag is not None:
+            if isinstance(found.children, list) or tag not in found.children:
+                return None
         return found
 
     def search(self, name, number=None, node=None, tag=None, exact=False):
@@ -322,7 +415,8 @@ class CollectionTree(object):
 
 
     def _load(self, uri, fromuri):
-        '''when we start here, we've been passed a Dockerfile.
+        '''when we start here, we've been passed a Dockerfile. The pair is
+           loaded (and validated) with load_pair.
         '''
 
         # Case 1: It's not valid to have a Dockerfile as the image URI
@@ -332,59 +426,10 @@ class CollectionTree(object):
                 bot.error('Did you correctly specify the variable order?')
                 return None
 
-        # Case 2. if we loaded a container-diff uri, it will be a uri
-        if not "Dockerfile" in fromuri:     
-            return {"Image": uri, "From": fromuri}
-
-        # Case 3: Load the FROM in the Dockerfile            
-        if os.path.exists(fromuri):
-            froms = [x for x in self._load_dockerfile(fromuri, action="FROM") if x]
-
-            # If we find the FROM, we want to extract history to get all from
-            # In future, could support more than one from here
-            if len(froms) > 0:
-                 
-                # We can't use any AS statements 
-                if " as " in froms[0].lower():
-                    return None
-
-                # Remove any extra comments, etc. next to FROM <container>
-                fromuri = froms[0].split(' ')[0]
-
-                # Validate the uris
-                for image in [uri, fromuri]:
-                    if not parse_image_uri(image):
-                        return None
-                    # Don't allow uppercase or invalid endings
-                    if image.isupper() or re.search('-$', image):
-                        return None
-
-                # Don't allow environment vars or similar
-                literals = ['$', '}', '{', "'", '"']
-                expression = "(%s)" % '|'.join(["[%s]" %x for x in literals])
-                regexp = re.compile(expression)
-
-                # Another condition for not parsing, if a variable is in uri
-                if not regexp.search(uri) and not regexp.search(fromuri):
-                    return {"Image": uri, "From": fromuri}
-
-
-    def _load_dockerfile(self, dockerfile, action=None):
-        '''extract one or more actions from a Dockerfile. If action is not
-           defined, then return all that are found.
-        '''
-        lines = []
-        with open(dockerfile, 'r') as filey:
-            for line in filey.readlines():
-                if action != None:
-                    match = re.search("^%s" % action.upper(), line.strip().upper())
-                    if match:
-                        line = (line[match.end()+1:]).strip()
-                        lines.append(line)
-                else:
-                    lines.append(line)
-        return lines
-
+        # Case 2: a uri, or the FROM in the Dockerfile
+        pair = load_pair(uri, fromuri)
+        if pair:
+            return {"Image": pair[0], "From": pair[1]}
 
 
     def update(self, uri, fromuri, tag=None):
@@ -403,6 +448,74 @@ class CollectionTree(object):
 
 # Tree Generation
 
+    def build(self, pairs, tag=None, workers=1):
+        '''add many (uri, fromuri) pairs in one pass. As with update, the
+           fromuri can be a Dockerfile to read the FROM from. All pairs are
+           loaded first, to find the children of each parent, and then
+           the pairs are added in (breadth first) order from the parents
+           that can be added to the tree: scratch, containers already in
+           the tree, and first level containers. A container is added
+           after its parent, so we don't need to update with the pairs
+           more than once (a first level container can be added to the
+           root first, and then moved under its parent). When a
+           container has pairs with different parents, the last one added
+           is kept (as for update). A dictionary is returned with the
+           number of pairs added, the pairs that couldn't be loaded
+           (invalid), and the pairs that don't have a path to the tree
+           (orphans). The pairs (and Dockerfiles) can be loaded in a pool
+           of worker processes (see load_pairs).
+
+           Parameters
+           ==========
+           pairs: a list of (uri, fromuri) pairs
+           tag: if defined, a tag to give the nodes (not the container tag)
+           workers: the number of processes to load the pairs with
+        '''
+        children = {}
+        invalid = []
+
+        pairs = [tuple(pair) for pair in pairs]
+        for (uri, fromuri), loaded in zip(pairs, load_pairs(pairs, workers)):
+            if not loaded:
+                invalid.append((uri, fromuri))
+                continue
+
+            image = parse_image_uri(loaded[0])
+            parent = loaded[1]
+            if parent != 'scratch':
+                parent = parse_image_uri(parent)
+                if not image or not parent:
+                    invalid.append((uri, fromuri))
+                    continue
+                parent = parent['nodeUri']
+            elif not image:
+                invalid.append((uri, fromuri))
+                continue
+
+            children.setdefault(parent, []).append((image['nodeUri'], loaded))
+
+        # Start from parents that can be added to the tree
+        queue = deque(parent for parent in children if parent == 'scratch' or
+                      parent in self._index or parent.startswith(self._first_level))
+
+        added = 0
+        seen = set(queue)
+        while queue:
+            parent = queue.popleft()
+            for image, loaded in children.pop(parent):
+                if self._make_tree(loaded[0], loaded[1], tag=tag):
+                    added += 1
+
+                # The children of the image can be added once it's in the tree
+                if image in children and image not in seen and image in self._index:
+                    seen.add(image)
+                    queue.append(image)
+
+        orphans = [loaded for parent in children for image, loaded in children[parent]]
+
+        return {'added': added, 'invalid': invalid, 'orphans': orphans}
+
+
 
     def _make_tree(self, uri, fromuri, tag=None):
         '''construct the tree from the loaded data (self.data) which for
@@ -460,7 +573,7 @@ class CollectionTree(object):
 
             # Only return already present if found with exact tag/parent
             if uriImage['repo_tag'] in nodeFrom.children:
-                if nodeImage in nodeFrom.children[uriImage['repo_tag']]: 
+                if self._is_child(nodeFrom, nodeImage, uriImage['repo_tag']):
 
                     # Ensure we have the child tag
                     if uriImage['repo_tag'] not in nodeImage.children:
@@ -477,7 +590,7 @@ class CollectionTree(object):
             append_root = True
 
         # If the tag isn't there, add it (this is the parent)
-        if isinstance(nodeFrom.children, dict):
+        if not isinstance(nodeFrom.children, list):
             if uriFrom['repo_tag'] not in nodeFrom.children:
                 nodeFrom.children[uriFrom['repo_tag']] = []
 
@@ -493,28 +606,28 @@ class CollectionTree(object):
         if uriImage['repo_tag'] not in nodeImage.children:
             nodeImage.children[uriImage['repo_tag']] = []
 
-        # Remove the nodeImage from the tree, if it's found
-        self.remove(name = nodeImage.label)
+        # Detach the nodeImage from its parent (the index is updated below)
+        in_tree = self._index.get(nodeImage.name) is nodeImage
+        self._remove_child(nodeImage)
 
         # Add the tag, if defined (this is not the uri tag, but another)
         if tag is not None:
             if tag not in nodeImage.tags:
                 nodeImage.tags.add(tag)
        
-        # Special case for the root node, update the lookup and add first level
+        # Special case for the root node, add first level
         if nodeFrom == self.root:
-            self._index[nodeImage.name] = self._index[nodeFrom.name]
 
             # The image isn't in root's children, but we can add it there!
-            if nodeImage not in nodeFrom.children and nodeImage.label.startswith(self._first_level):
-                nodeFrom.children.append(nodeImage)    
+            if not self._is_child(nodeFrom, nodeImage) and nodeImage.label.startswith(self._first_level):
+                self._add_child(nodeFrom, nodeImage)
                 present = True
 
         else:
 
             # We now have a nodeFrom and a nodeImage, we can append        
-            if nodeImage not in nodeFrom.children[uriFrom['repo_tag']]:
-                nodeFrom.children[uriFrom['repo_tag']].append(nodeImage)
+            if not self._is_child(nodeFrom, nodeImage, uriFrom['repo_tag']):
+                self._add_child(nodeFrom, nodeImage, uriFrom['repo_tag'])
                 present = True
 
             # We only append library to the root.
@@ -523,22 +636,24 @@ class CollectionTree(object):
                 # We can append
                 if nodeFrom.label.startswith(self._first_level):
 
-                    # If adding to the root, we likely don't have the parent node
-                    if nodeFrom.name not in self._index:
-                        self._index[nodeFrom.name] = self._index[self.root.name]
-
-                    self._index[nodeImage.name] = '%s|%s|%s' %(self._index[nodeFrom.name],
-                                                               nodeFrom.name,
-                                                               uriFrom['repo_tag'])
-
-                    if nodeFrom not in self.root.children:
-                        self.root.children.append(nodeFrom)             
+                    if not self._is_child(self.root, nodeFrom):
+                        self._add_child(self.root, nodeFrom)
+                        self._index[nodeFrom.name] = nodeFrom
+                        self._rank(nodeFrom)
                     present = True
 
                 # If we need to append to the root but the nodeFrom label isn't in it
                 else:
                     present = False 
 
+        # Update the index if the nodeImage was added to or left the tree
+        if self._in_tree(nodeImage):
+            if not in_tree:
+                self._register(nodeImage)
+        elif in_tree:
+            self._unregister(nodeImage)
+            self.count -= 1
+
         # If it was a leaf, no longer is
         nodeFrom.leaf = False
         return present
@@ -551,7 +666,10 @@ class CollectionTree(object):
                     tag_prefix='.',
                     label=None):
 
-        '''Get all paths to nodes, as an iterator
+        '''Get all paths to nodes, as an iterator. If one or more labels are
+           given, each node is looked up in the index, and its path is made
+           by walking up the parent links, so we don't walk the tree. The
+           paths are returned in the order of the labels.
 
            Parameters
            ==========
@@ -561,31 +679,24 @@ class CollectionTree(object):
            label: get the path for one (string) or more (list) nodes.
         '''
 
-        def traverse(current, path='', label=None):
+        def traverse(current, path=''):
 
             # Update the path with the current
             path = path + '/' + current.name
 
             # Does the user want to export leaves only?
             if (leaves_only and current.leaf) or not leaves_only:
-
-                # Does the user only want specific label(s)?
-                if label != None:
-                    if current.name in label:
-                        label.remove(current.name)
-                        yield path
-                else:
-                    yield path
+                yield path
 
             # Case 1: We are at the root (and have list)
             if isinstance(current.children, list):
                 for child in current.children:
-                    for new_path in traverse(child, path, label):
+                    for new_path in traverse(child, path):
                         yield new_path
 
-            # Case 2: we have a dictionary
+            # Case 2: we have children by tag
             else:
-                for tag, children in current.children.items():
+                for tag, children in current.children._groups():
                     for child in children:
 
                         # tags are represented by hidden folders
@@ -597,7 +708,7 @@ class CollectionTree(object):
                             new_path = path
 
                         # Reveal the paths
-                        for new_path in traverse(child, new_path, label):
+                        for new_path in traverse(child, new_path):
                             yield new_path
 
         # Does the user want a particular set of labels?
@@ -605,13 +716,33 @@ class CollectionTree(object):
             if not isinstance(label, list):
                 label = [label]
 
-            # Create a set for more efficient lookup
-            label = set(label)
-
-        for path in traverse(self.root, label=label):
+            seen = set()
+            for name in label:
+                node = self._index.get(name)
+                if node is None or name in seen:
+                    continue
+                seen.add(name)
+                if (leaves_only and node.leaf) or not leaves_only:
+                    yield self._path(node, add_tags, tag_prefix)
+            return
+
+        for path in traverse(self.root):
             yield path
 
 
+    def _path(self, node, add_tags=True, tag_prefix='.'):
+        '''return the path to a node (see paths) from the parent links, in
+           time proportional to the depth of the node.
+        '''
+        parts = []
+        while node is not None:
+            parts.append(node.name)
+            if add_tags and node._parent_tag is not None:
+                parts.append(tag_prefix + node._parent_tag)
+            node = node._parent
+        return '/' + '/'.join(reversed(parts))
+
+
     def get_paths(self, leaves_only=False, add_tags=True, tag_prefix='.', label=None):
 
         '''Get all paths to nodes, in a list.
@@ -629,6 +760,98 @@ class CollectionTree(object):
                                label=label))
 
 
+    def materialize(self, root_dir, workers=1, metadata=None, add_tags=True,
+                          tag_prefix='.'):
+        '''create the folders for the paths of the tree (see paths) under a
+           root folder, e.g., materialize('/') creates /scratch and the
+           folders under it. We walk the tree once, and create each folder
+           once with os.mkdir, a parent before its children (a folder that
+           already exists is kept). The folders at each depth can be created
+           by a pool of threads, for example on a network filesystem. If
+           metadata is defined, the attributes of each node are written (as
+           json) to a file with that name in its folder. The number of
+           folders created is returned.
+
+           Parameters
+           ==========
+           root_dir: the folder to create the tree in
+           workers: the number of threads to create the folders with
+           metadata: if defined, the file name for node attributes
+           add_tags: add tags to tree (also as folders)
+           tag_prefix: if adding tags, use this prefix.
+        '''
+        # Folders (and nodes, to write metadata) in depth first order
+        folders = []
+        seen = {}
+
+        def add(folder, depth):
+            if folder not in seen:
+                seen[folder] = [folder, None, depth]
+                folders.append(seen[folder])
+            return seen[folder]
+
+        stack = [(self.root, root_dir, 0)]
+        while stack:
+            node, folder, depth = stack.pop()
+            for name in node.name.split('/'):
+                folder = os.path.join(folder, name)
+                item = add(folder, depth)
+                depth += 1
+            item[1] = node
+
+            if isinstance(node.children, list):
+                for child in reversed(node.children):
+                    stack.append((child, folder, depth))
+                continue
+
+            for tag, children in node.children._groups():
+                if not children:
+                    continue
+                parent, level = folder, depth
+                if add_tags:
+                    parent = os.path.join(folder, tag_prefix + tag)
+                    add(parent, depth)
+                    level += 1
+                for child in reversed(children):
+                    stack.append((child, parent, level))
+
+        def create(item):
+            folder, node, depth = item
+            try:
+                os.mkdir(folder)
+                created = 1
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+                created = 0
+
+            if metadata is not None and node is not None:
+                with open(os.path.join(folder, metadata), 'w') as filey:
+                    filey.writelines(json.dumps(node.get_attributes()))
+            return created
+
+        if not os.path.exists(root_dir):
+            os.makedirs(root_dir)
+
+        if workers <= 1:
+            return sum(create(item) for item in folders)
+
+        # With threads, all parents are created before the next depth
+        levels = []
+        for item in folders:
+            while len(levels) <= item[2]:
+                levels.append([])
+            levels[item[2]].append(item)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        try:
+            return sum(sum(pool.map(create, level)) for level in levels)
+        finally:
+            pool.close()
+            pool.join()
+
+
     def get_nodes(self):
         '''return a list of nodes (a call to __iter__)
         '''
@@ -638,17 +861,17 @@ class CollectionTree(object):
     def __iter__(self):
         '''an iterator over MultiNodes to yield nodes, one at a time.
         '''
-        def traverse(current, seen):
-            for child in current.get_children():
+        seen = set()
+        stack = [iter(self.root.children)]
+        while stack:
+            for child in stack[-1]:
                 if child.name not in seen:
                     seen.add(child.name)
                     yield child
-                    for child in traverse(child, seen):
-                        yield child
-
-        seen = set()
-        for node in traverse(self.root, seen):
-            yield node  
+                    stack.append(iter(child.children.nodes()))
+                    break
+            else:
+                stack.pop()
 
 
     def export_tree(self, filename=None):
@@ -664,17 +887,17 @@ class CollectionTree(object):
 
         '''
 
+        colors = ['#0000FF', # blue
+                  '#FF7F00', # orange
+                  '#FF0000', # red
+                  '#7F007F', # purple
+                  '#00FFFF', # cyan
+                  '#0560D0'] # generic blue
+
         # We will call this recursively
  
         def traverse(nodes={}, current=None):
 
-            colors = ['#0000FF', # blue
-                      '#FF7F00', # orange
-                      '#FF0000', # red
-                      '#7F007F', # purple
-                      '#00FFFF', # cyan
-                      '#0560D0'] # generic blue
-
             if current is None:
                 current = self.root
 
@@ -726,6 +949,51 @@ class CollectionTree(object):
         return counter
 
 
+    def get_descendant_count(self, name, tag=None):
+        '''return the number of containers built on a container (at any
+           depth), or only on one of its tags. The counts are kept as
+           containers are added and removed, so this is a lookup.
+
+           Parameters
+           ==========
+           name: the name of the container (e.g., library/alpine)
+           tag: if defined, only count containers built on this tag
+        '''
+        node = self.find(name, tag=tag)
+        if node is None:
+            return 0
+        if tag is None:
+            return node._descendants
+        return (node._tag_descendants or {}).get(tag, 0)
+
+
+    def most_depended_on(self, k=10, by_tag=False):
+        '''return the k containers with the most containers built on them
+           (at any depth). The containers in the index are ranked by
+           their descendant counts as the counts change, so we only read
+           about k of them from the largest count down. A list of (node,
+           count) is returned, from most to least, or (node, tag, count)
+           to rank each tag of a container separately. Containers with the
+           same count are in no particular order, and the root (scratch)
+           isn't included.
+
+           Parameters
+           ==========
+           k: the number of containers (or tags) to return
+           by_tag: if True, rank each container tag
+        '''
+        if by_tag:
+            return [(self._index[name], tag, count)
+                    for (name, tag), count in self._tag_ranks.top(k)]
+        return [(self._index[name], count) for name, count in self._ranks.top(k)]
+
+
+# Ancestry Functions
+CollectionTree.ancestry = ancestry
+CollectionTree.is_descendant = is_descendant
+CollectionTree.descendants = descendants
+CollectionTree.common_ancestor = common_ancestor
+
 # Loading Functions
 CollectionTree._update = _update
 CollectionTree._load_http = _load_http
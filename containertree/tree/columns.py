@@ -0,0 +1,260 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A columnar (NumPy) view of a tree, with one row per node in depth first
+# order. Each attribute (parent, depth, size, counter, leaf) is an array, and
+# a sparse incidence matrix has the tags of each node, so totals, filters and
+# group bys over many nodes are vectorized instead of a walk over the tree.
+# Since a subtree is a contiguous range of rows, the nodes under a path are
+# a slice.
+
+
+class TreeColumns(object):
+
+    _names = ['parent', 'depth', 'size', 'counter', 'leaf', 'children']
+    _functions = ['sum', 'count', 'mean', 'max', 'min']
+
+    def __init__(self, tree):
+        '''build the columns for a tree, in one (depth first) pass. Row 0
+           is the root, and the rows for the subtree of row i are i up to
+           (not including) end[i]. A compressed (radix) node is one row,
+           with the depth of its first component, and each of its paths
+           is found at the row.
+
+           parent: the row of the parent node (-1 for the root)
+           depth: the depth of the node (the root is 0)
+           size: the size attribute of the node (0 if not defined)
+           counter: the number of times the node was added
+           leaf: True if a path ends at the node
+           children: the number of children of the node
+
+           Parameters
+           ==========
+           tree: the ContainerTree (or subclass) to build the columns for
+        '''
+        from scipy import sparse
+        import numpy
+
+        self.folder_sep = tree.folder_sep
+        self.tags = sorted(tree.root.tags)
+        self._tag_columns = dict((tag, i) for i, tag in enumerate(self.tags))
+
+        self.nodes = []
+        self.paths = []
+        self.rows = {'': 0}
+        parent = []
+        depth = []
+        size = []
+        counter = []
+        leaf = []
+        children = []
+        rows = []
+        cols = []
+
+        # Children are pushed in reverse, so rows follow the tree order
+        stack = [(tree.root, -1, 0, '')]
+        while stack:
+            node, up, level, path = stack.pop()
+            row = len(self.nodes)
+            if up >= 0:
+                for segment in list(node.prefix) + [node.label]:
+                    path = path + self.folder_sep + segment
+                    self.rows[path] = row
+
+            self.nodes.append(node)
+            self.paths.append(path)
+            parent.append(up)
+            depth.append(level)
+            size.append(getattr(node, 'size', 0) or 0)
+            counter.append(node.counter)
+            leaf.append(node.leaf)
+            children.append(len(node.children))
+
+            found = [self._tag_columns[t] for t in node.tags if t in self._tag_columns]
+            rows.extend([row] * len(found))
+            cols.extend(found)
+
+            for child in reversed(node.children):
+                stack.append((child, row, level + len(node.prefix) + 1, path))
+
+        count = len(self.nodes)
+        self.parent = numpy.array(parent, dtype=numpy.int64)
+        self.depth = numpy.array(depth, dtype=numpy.int64)
+        self.size = numpy.array(size, dtype=numpy.float64)
+        self.counter = numpy.array(counter, dtype=numpy.int64)
+        self.leaf = numpy.array(leaf, dtype=bool)
+        self.children = numpy.array(children, dtype=numpy.int64)
+        self.incidence = sparse.csr_matrix((numpy.ones(len(rows), dtype=numpy.int8),
+                                            (rows, cols)),
+                                           shape=(count, len(self.tags)))
+
+        # The subtree of a row ends after all of its descendants
+        descendants = numpy.ones(count, dtype=numpy.int64)
+        for row in range(count - 1, 0, -1):
+            descendants[self.parent[row]] += descendants[row]
+        self.end = numpy.arange(count) + descendants
+
+    def __str__(self):
+        return "TreeColumns<%s:%s>" % (len(self.nodes), len(self.tags))
+    def __repr__(self):
+        return "TreeColumns<%s:%s>" % (len(self.nodes), len(self.tags))
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def row(self, path):
+        '''return the row for a path, or None if it isn't in the tree'''
+        path = path.rstrip(self.folder_sep)
+        if path and not path.startswith(self.folder_sep):
+            path = self.folder_sep + path
+        return self.rows.get(path)
+
+
+    def mask(self, path=None, tag=None, leaf=None):
+        '''return a boolean array of the rows to include, for a path (the
+           node and everything under it), a tag, and (if leaf is True or
+           False) leaf nodes or not. None is returned for a path or tag
+           that isn't in the tree.
+
+           Parameters
+           ==========
+           path: only include the subtree of a path
+           tag: only include nodes with a tag
+           leaf: if True only leaves, if False only nodes that aren't leaves
+        '''
+        import numpy
+
+        mask = numpy.ones(len(self.nodes), dtype=bool)
+
+        if path is not None:
+            row = self.row(path)
+            if row is None:
+                return None
+            mask[:row] = False
+            mask[self.end[row]:] = False
+
+        if tag is not None:
+            if tag not in self._tag_columns:
+                return None
+            column = self.incidence[:, self._tag_columns[tag]]
+            mask &= column.toarray().ravel() > 0
+
+        if leaf is not None:
+            mask &= self.leaf == leaf
+
+        return mask
+
+
+    def aggregate(self, column='size', by=None, func='sum', path=None,
+                                       tag=None, leaf=None):
+        '''aggregate a column over the nodes that match a path, tag and leaf
+           (see mask). If by is None, one value is returned. If by is tag,
+           a dictionary of values for each tag is returned, and otherwise
+           by is a column (e.g., depth or parent) to group by, and a
+           dictionary of values for each (unique) value of the column. For
+           example, the total size of leaves under /opt for each container:
+
+           columns.aggregate('size', by='tag', path='/opt', leaf=True)
+
+           Parameters
+           ==========
+           column: the column to aggregate (parent, depth, size, counter,
+                   leaf or children)
+           by: None, tag, or a column to group by
+           func: the aggregate, one of sum, count, mean, max or min
+           path: only include the subtree of a path
+           tag: only include nodes with a tag
+           leaf: if True only leaves, if False only nodes that aren't leaves
+        '''
+        import numpy
+
+        if column not in self._names or by not in self._names + [None, 'tag']:
+            print('%s is not a valid column, choices are %s' % (column if column
+                  not in self._names else by, self._names))
+            return None
+
+        if func not in self._functions:
+            print('%s is not a valid function, choices are %s' % (func, self._functions))
+            return None
+
+        mask = self.mask(path=path, tag=tag, leaf=leaf)
+        if mask is None:
+            return None
+
+        values = getattr(self, column).astype(numpy.float64)
+
+        if by is None:
+            return _reduce(values[mask], func)
+
+        # A tag without any nodes in the mask is left out
+        if by == 'tag':
+            incidence = self.incidence.T.tocsr()
+            counts = incidence.dot(mask.astype(numpy.float64))
+
+            if func in ['max', 'min']:
+                found = self.incidence.tocoo()
+                keep = mask[found.row]
+                reduce = numpy.maximum if func == 'max' else numpy.minimum
+                result = numpy.full(len(self.tags), -numpy.inf if func == 'max' else numpy.inf)
+                reduce.at(result, found.col[keep], values[found.row[keep]])
+                return dict((t, result[i].item())
+                            for i, t in enumerate(self.tags) if counts[i] > 0)
+
+            sums = incidence.dot(numpy.where(mask, values, 0))
+            return dict((t, _combine(sums[i], counts[i], func))
+                        for i, t in enumerate(self.tags) if counts[i] > 0)
+
+        keys, groups = numpy.unique(getattr(self, by)[mask], return_inverse=True)
+        values = values[mask]
+
+        if func in ['max', 'min']:
+            reduce = numpy.maximum if func == 'max' else numpy.minimum
+            result = numpy.full(len(keys), -numpy.inf if func == 'max' else numpy.inf)
+            reduce.at(result, groups, values)
+            return dict((k.item(), v.item()) for k, v in zip(keys, result))
+
+        counts = numpy.bincount(groups, minlength=len(keys))
+        sums = numpy.bincount(groups, weights=values, minlength=len(keys))
+        return dict((k.item(), _combine(sums[i], counts[i], func))
+                    for i, k in enumerate(keys))
+
+
+def _reduce(values, func):
+    '''reduce an array of values with an aggregate function'''
+    if func == 'count':
+        return len(values)
+    if len(values) == 0:
+        return 0.0 if func == 'sum' else None
+    return getattr(values, func)().item()
+
+
+def _combine(total, count, func):
+    '''return an aggregate from a sum and a count'''
+    if func == 'count':
+        return int(count)
+    if func == 'mean':
+        return (total / count).item() if count else None
+    return float(total)
+
+
+def columns(self):
+    '''return the columnar (NumPy) view of the tree (see TreeColumns) to
+       calculate aggregates over many nodes. The view is built the first
+       time it's needed, and rebuilt after the tree changes.
+    '''
+    if self._columns is None:
+        self._columns = TreeColumns(self)
+    return self._columns
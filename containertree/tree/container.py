@@ -23,7 +23,38 @@ import os
 import re
 import sys
 
+from containertree.utils.versions import (
+    debian_version_key,
+    pep440_version_key
+)
 from .base import ( ContainerTreeBase, Node )
+from .radix import (
+    _split_path,
+    _radix_child,
+    _split_radix,
+    _make_radix_tree,
+    _find_radix,
+    _search_radix
+)
+from .rollup import (
+    rollup,
+    _rollup_path,
+    _find_rollup,
+    du
+)
+from .bloom import (
+    bloom,
+    _bloom_filter,
+    _bloom_path,
+    contains,
+    contains_any
+)
+from .packages import (
+    index_packages,
+    _index_version,
+    versions_of,
+    containers_with
+)
 
 
 class ContainerTree(ContainerTreeBase):
@@ -51,11 +82,10 @@ class ContainerTree(ContainerTreeBase):
 
             # The starting node is the root node
             node = self.root
+            path = [node]
 
             # Add the tag to the new (or existing) node
-            if tag is not None:
-                if tag not in node.tags:
-                    node.tags.add(tag)
+            self._tag_node(node, tag)
 
             filepaths = attrs['Name'].split(self.folder_sep)
         
@@ -100,13 +130,15 @@ class ContainerTree(ContainerTreeBase):
                     # Keep working down the tree
                     node = new_node
 
+                if node is not path[-1]:
+                    path.append(node)
+
                 # Add the tag to the new (or existing) node
-                if tag is not None:
-                    if tag not in node.tags:
-                        node.tags.add(tag)
+                self._tag_node(node, tag)
 
             # The last in the list is the leaf (file)
             node.leaf = True
+            self._touch_path(path, tag)
 
 
 class ContainerDiffTree(ContainerTree):
@@ -165,17 +197,34 @@ class ContainerFileTree(ContainerDiffTree):
     '''a container file tree will build a file hierarchy tree using the 
        Container Diff File export. This is the base implementation of 
        ContainerTree, so we don't need to write a function to generate
-       the tree here.
+       the tree here. If radix is True, unbranched chains of folders
+       (e.g., usr/share/doc) are compressed into one node, and split
+       when a new sibling is added.
     '''
+    def __init__(self, inputs=None, tag=None, folder_sep="/", radix=False):
+        self.radix = radix
+        super(ContainerFileTree, self).__init__(inputs, tag, folder_sep)
 
     def _load(self, data=None):
         return self._filter_container_diff(data, analyze_type="File")
 
+    def _make_tree(self, data=None, tag=None):
+        if self.radix:
+            return self._make_radix_tree(data, tag)
+        return super(ContainerFileTree, self)._make_tree(data, tag)
+
+    def search(self, name, number=None, node=None):
+        if self.radix and node == None:
+            return self._search_radix(name, number)
+        return super(ContainerFileTree, self).search(name, number, node)
+
     def find(self, filepath):
         '''find a path in the tree and return the node if found. For a Container
            Tree, we expect a filepath. This must be the absolute filepath.
            To do a search, use search instead.
         '''
+        if self.radix:
+            return self._find_radix(filepath)
 
         # We always start at the root  
         node = self.root
@@ -216,6 +265,28 @@ class ContainerFileTree(ContainerDiffTree):
                         break
 
 
+# Radix Functions
+ContainerFileTree._split_path = _split_path
+ContainerFileTree._radix_child = _radix_child
+ContainerFileTree._split_radix = _split_radix
+ContainerFileTree._make_radix_tree = _make_radix_tree
+ContainerFileTree._find_radix = _find_radix
+ContainerFileTree._search_radix = _search_radix
+
+# Rollup Functions
+ContainerFileTree.rollup = rollup
+ContainerFileTree._rollup_path = _rollup_path
+ContainerFileTree._find_rollup = _find_rollup
+ContainerFileTree.du = du
+
+# Bloom Filter Functions
+ContainerFileTree.bloom = bloom
+ContainerFileTree._bloom_filter = _bloom_filter
+ContainerFileTree._bloom_path = _bloom_path
+ContainerFileTree.contains = contains
+ContainerFileTree.contains_any = contains_any
+
+
 class ContainerPackageTree(ContainerDiffTree):
     '''a container package tree will generate a container tree based on some
        package manager. Since the output is from container-diff, we expect
@@ -224,6 +295,12 @@ class ContainerPackageTree(ContainerDiffTree):
        [{'Name': 'zlib1g', 'Size': 159744, 'Version': '1:1.2.8.dfsg-5'}..] 
     '''
 
+    # An optional package -> sorted versions index, see index_packages
+    _package_index = None
+
+    # Parse a version string into a sortable key
+    _version_key = staticmethod(debian_version_key)
+
     def __str__(self):
         return "Container%sTree<%s>" % (self.analyze_type, self.count)
     def __repr__(self):
@@ -253,6 +330,16 @@ class ContainerPackageTree(ContainerDiffTree):
         if "pandas" not in locals():
             import pandas
 
+        # Starting from the root, collect all features in one pass
+        if node == None and not hasattr(df, 'add'):
+            rows, columns, row_index, column_index = self._vector_pairs(
+                include_tags, skip_tags, regexp_tags, include_versions)
+
+            import numpy
+            values = numpy.full((len(rows), len(columns)), numpy.nan)
+            values[row_index, column_index] = 1
+            return pandas.DataFrame(values, index=rows, columns=columns)
+
         # Checks if we have initialized the df yet (can't compare to None)
         if not hasattr(df, 'add'):
             df = pandas.DataFrame()
@@ -306,6 +393,93 @@ class ContainerPackageTree(ContainerDiffTree):
         return df
 
 
+    def export_sparse(self, include_tags=None, skip_tags=None,
+                            regexp_tags=None, include_versions=False,
+                            dataframe=False):
+        '''export the same vectors as export_vectors, but as a sparse matrix
+           (scipy.sparse CSR) of containers (rows) by packages (columns),
+           built from a single pass over the tree. A tuple of the matrix, 
+           the row labels and the column labels is returned, unless
+           dataframe is True (then a sparse pandas DataFrame).
+
+           Parameters
+           ==========
+           include_tags: a list of container uris to include
+           skip_tags: a list o container uris to skip
+           regexp_tags: include tags based ona regular expression
+           include_versions: optionally include versions as part of the features
+           dataframe: return a (sparse) pandas DataFrame instead
+        '''
+        from scipy import sparse
+        import numpy
+
+        rows, columns, row_index, column_index = self._vector_pairs(
+            include_tags, skip_tags, regexp_tags, include_versions)
+
+        matrix = sparse.csr_matrix((numpy.ones(len(row_index), dtype=numpy.int8),
+                                   (row_index, column_index)),
+                                   shape=(len(rows), len(columns)))
+
+        if dataframe:
+            import pandas
+            return pandas.DataFrame.sparse.from_spmatrix(matrix,
+                                                         index=rows,
+                                                         columns=columns)
+        return matrix, rows, columns
+
+
+    def _vector_pairs(self, include_tags=None, skip_tags=None,
+                            regexp_tags=None, include_versions=False):
+        '''collect the (container, feature) pairs for export_vectors and
+           export_sparse in one pass. Rows and columns are numbered in the
+           order they are first seen, and we return the row labels, column
+           labels, and the row and column index for each pair.
+        '''
+        rows = {}
+        columns = {}
+        row_index = []
+        column_index = []
+
+        if include_tags != None:
+            include_tags = set(include_tags)
+        if skip_tags != None:
+            skip_tags = set(skip_tags)
+        if regexp_tags != None:
+            regexp_tags = re.compile(regexp_tags)
+
+        # The filter result for each container is the same for all nodes
+        keep = {}
+
+        def add(label, containers):
+            column = columns.setdefault(label, len(columns))
+            for container in containers:
+                if container not in keep:
+                    keep[container] = (
+                        (include_tags == None or container in include_tags) and
+                        (skip_tags == None or container not in skip_tags) and
+                        (regexp_tags == None or regexp_tags.search(container) != None))
+                if keep[container]:
+                    row_index.append(rows.setdefault(container, len(rows)))
+                    column_index.append(column)
+
+        for package in self.root.children:
+            if not include_versions:
+                add(package.label, package.tags)
+            else:
+                for version in package.children:
+                    add('%s-v%s' %(package.label, version.label), version.tags)
+
+        # A column is only kept if a container has it
+        used = sorted(set(column_index))
+        if len(used) != len(columns):
+            renumber = dict((c, i) for i, c in enumerate(used))
+            column_index = [renumber[c] for c in column_index]
+            labels = list(columns)
+            columns = dict((labels[c], i) for i, c in enumerate(used))
+
+        return list(rows), list(columns), row_index, column_index
+
+
     def _make_tree(self, data=None, tag=None):
         '''construct the tree from the loaded data (self.data)
            we should already have a root defined. Since we are making
@@ -323,24 +497,46 @@ class ContainerPackageTree(ContainerDiffTree):
             node = self.root
 
             # Add the tag to the new (or existing) node
-            if tag is not None:
-                if tag not in node.tags:
-                    node.tags.add(tag)
+            self._tag_node(node, tag)
         
             # Add the node to the tree based on package name
             new_node = self.add(package['Name'], node, tag=tag)
 
             # Add the version Node
+            count = self.count
             version_node = self.add(package['Version'], new_node, tag=tag)   
 
             # The last in the list is the leaf (file)
             version_node.leaf = True
 
+            # Update anything we keep about the nodes along the path
+            self._touch_path([node, new_node, version_node], tag)
+
+            # A new version is added to the package index
+            if self._package_index is not None and self.count > count:
+                self._index_version(package['Name'], version_node)
+
+
+    def _touch_path(self, path, tag=None, removed=None):
+        '''after a remove, the package index is rebuilt when next needed'''
+        super(ContainerPackageTree, self)._touch_path(path, tag, removed)
+        if removed is not None:
+            self._package_index = None
+
+
+# Package Index Functions
+ContainerPackageTree.index_packages = index_packages
+ContainerPackageTree._index_version = _index_version
+ContainerPackageTree.versions_of = versions_of
+ContainerPackageTree.containers_with = containers_with
+
 
 class ContainerPipTree(ContainerPackageTree):
     '''a container pip tree will generate a container tree based on pip
        packages.
     '''
+    _version_key = staticmethod(pep440_version_key)
+
     def __init__(self, inputs=None, tag=None, folder_sep="/"):
         self.analyze_type = "Pip"
         super(ContainerPipTree, self).__init__(inputs, tag, folder_sep)
@@ -0,0 +1,240 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A FrozenTree is an immutable, hash-consed copy of a built tree. Subtrees
+# that are identical (labels, attributes and relative tags) are stored once
+# and shared between parents, and tags are kept as an overlay on the edges.
+
+from .similarity import ( _check_weight, _weigh )
+
+
+class FrozenNode(object):
+    '''a FrozenNode is a shared, immutable node. The label is a tuple of
+       path components (more than one for a radix node), and children is a
+       tuple of (FrozenNode, tags) where tags is None if the child has the
+       same tags as the parent, and otherwise a (shared) frozenset.
+    '''
+    __slots__ = ('label', 'leaf', 'attrs', 'children', 'count')
+
+    def __init__(self, label, leaf, attrs, children):
+        self.label = label
+        self.leaf = leaf
+        self.attrs = attrs
+        self.children = children
+
+        # The number of nodes in the (expanded) subtree
+        self.count = len(label) + sum(c.count for c, tags in children)
+
+    def __str__(self):
+        return "FrozenNode<%s>" % '/'.join(self.label)
+    def __repr__(self):
+        return "FrozenNode<%s>" % '/'.join(self.label)
+
+    def get_attributes(self):
+        '''return the attributes of the node as a dictionary'''
+        return dict(self.attrs)
+
+
+class FrozenTree(object):
+
+    # Attributes that are structure, or depend on the position in the tree
+    _skip = ('children', 'prefix', 'label', 'leaf', 'tags', 'name')
+
+    def __init__(self, tree):
+        '''create an immutable, hash-consed copy of a built tree (usually
+           from tree.freeze()). Identical subtrees are stored once, and the
+           tags are kept relative to the parent so the same subtree can be
+           shared between containers. Node names are not kept, as they
+           are determined by the path.
+
+           Parameters
+           ==========
+           tree: the ContainerTree (or subclass) to freeze
+        '''
+        self.folder_sep = tree.folder_sep
+        self._nodes = {}
+        self._tags = {}
+
+        self.tags = self._intern(tree.root.tags)
+        self.root = self._freeze(tree.root, self.tags)
+        self.count = self.root.count
+
+        # The lookup is only needed to build
+        self.unique = len(self._nodes)
+        self._nodes = None
+
+    def __str__(self):
+        return "FrozenTree<%s:%s>" % (self.unique, self.count)
+    def __repr__(self):
+        return "FrozenTree<%s:%s>" % (self.unique, self.count)
+
+
+    def _intern(self, tags):
+        '''return a shared frozenset for a set of tags'''
+        tags = frozenset(tags)
+        return self._tags.setdefault(tags, tags)
+
+
+    def _freeze(self, node, tags):
+        '''return the shared FrozenNode for node, which has the (already
+           interned) tags. We create it if an identical one isn't stored.
+        '''
+        children = []
+        for child in node.children:
+            child_tags = self._intern(child.tags)
+            overlay = None if child_tags == tags else child_tags
+            children.append((self._freeze(child, child_tags), overlay))
+        children = tuple(children)
+
+        attrs = []
+        for key, val in node.__dict__.items():
+            if key not in self._skip and not key.startswith('_'):
+                attrs.append((key, val))
+        attrs = tuple(sorted(attrs))
+
+        label = tuple(node.prefix) + (node.label,)
+        key = (label, node.leaf, self._hashable(attrs),
+               tuple((id(c), tags) for c, tags in children))
+
+        frozen = self._nodes.get(key)
+        if frozen is None:
+            frozen = FrozenNode(label, node.leaf, attrs, children)
+            self._nodes[key] = frozen
+        return frozen
+
+
+    def _hashable(self, attrs):
+        '''attributes are usually strings and numbers, but fall back to
+           the representation if one can't be hashed.
+        '''
+        try:
+            hash(attrs)
+            return attrs
+        except TypeError:
+            return repr(attrs)
+
+
+# Searching Functions
+
+    def similarity_score(self, tags, weight=None):
+        '''calculate the same similarity score as for the original tree,
+           with the same weights (see ContainerTreeBase.similarity_score).
+           The counts for a shared subtree only depend on the tags of its
+           root (and its depth, for the depth weight), so we compute them
+           once per (subtree, tags).
+
+           Parameters
+           ==========
+           tags: the tags (containers) to compare
+           weight: weight nodes by None (count), size, depth, or idf
+        '''
+        if not _check_weight(weight):
+            return None
+
+        tags = list(tags)
+        count = len(self.tags)
+        cache = {}
+
+        def traverse(node, node_tags, depth):
+            key = (id(node), node_tags, depth if weight == 'depth' else None)
+            if key in cache:
+                return cache[key]
+
+            size = 0
+            if weight == 'size' and node.leaf and not node.children:
+                size = dict(node.attrs).get('size', 0) or 0
+            node_weight = _weigh(weight, len(node.label), size, depth,
+                                 count, len(node_tags))
+            total = intersect = diff = 0
+
+            if all(t in node_tags for t in tags):
+                intersect += node_weight
+            else:
+                diff += node_weight
+
+            if any(t in node_tags for t in tags):
+                total += node_weight
+
+            depth += len(node.label)
+            for child, overlay in node.children:
+                counts = traverse(child, node_tags if overlay is None else overlay, depth)
+                total += counts[0]
+                intersect += counts[1]
+                diff += counts[2]
+
+            cache[key] = (total, intersect, diff)
+            return cache[key]
+
+        total, intersect, diff = traverse(self.root, self.tags, 0)
+
+        result = {'total': total,
+                  'tags': tags,
+                  'same': intersect,
+                  'diff': diff }
+
+        result['score'] = 0
+        if total > 0:
+           result['score'] = intersect / float(total)
+
+        return result
+
+
+    def find(self, filepath):
+        '''find a path and return a tuple of (FrozenNode, tags), or None if
+           the path isn't in the tree.
+        '''
+        node, tags = self.root, self.tags
+        components = [x for x in filepath.split(self.folder_sep) if x]
+
+        while components:
+            for child, overlay in node.children:
+                length = len(child.label)
+                if tuple(components[:length]) == child.label:
+                    node = child
+                    tags = tags if overlay is None else overlay
+                    components = components[length:]
+                    break
+            else:
+                return None
+
+        return node, tags
+
+
+    def paths(self, tag=None, leaves_only=True):
+        '''yield the paths in the tree, optionally for one tag. Since all
+           builders add a tag to every parent of a tagged node, we don't
+           descend into a subtree without the tag.
+
+           Parameters
+           ==========
+           tag: if defined, only yield paths for the tag (container)
+           leaves_only: only yield leaves (files), the default
+        '''
+        def traverse(node, tags, path):
+            if tag is not None and tag not in tags:
+                return
+
+            path = self.folder_sep.join((path,) + node.label)
+            if not leaves_only or node.leaf:
+                yield path
+
+            for child, overlay in node.children:
+                for new_path in traverse(child, tags if overlay is None else overlay, path):
+                    yield new_path
+
+        for child, overlay in self.root.children:
+            for path in traverse(child, self.tags if overlay is None else overlay, ''):
+                yield path
@@ -0,0 +1,116 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Tag index functions are shared between trees, and kept here. The index
+# maps each tag (container) to the nodes it touches, so that per-container
+# queries scale with the size of the answer and not the size of the tree.
+
+
+def index_tags(self):
+    '''build an index of tag -> {node id: node} for the tree, and keep it
+       updated for subsequent calls to _make_tree (insert, update, add).
+       The index is built on demand by files_of, diff and intersection,
+       so calling this directly is only needed to index during the build.
+    '''
+    self._tag_index = {}
+
+    def traverse(current):
+        for tag in current.tags:
+            self._tag_index.setdefault(tag, {})[id(current)] = current
+        for child in current.children:
+            traverse(child)
+
+    traverse(self.root)
+    return self._tag_index
+
+
+def _unindex(self, node):
+    '''remove a node (and all of its children) from the tag index, typically
+       after it has been removed from the tree.
+    '''
+    if self._tag_index is None:
+        return
+
+    for tag in node.tags:
+        postings = self._tag_index.get(tag, {})
+        postings.pop(id(node), None)
+        if not postings:
+            self._tag_index.pop(tag, None)
+
+    for child in node.children:
+        self._unindex(child)
+
+
+def _get_postings(self, tag):
+    '''return the postings (a dictionary of node id -> node) for a tag,
+       building the index first if we don't have it.
+    '''
+    if self._tag_index is None:
+        self.index_tags()
+    return self._tag_index.get(tag, {})
+
+
+def files_of(self, tag, leaves_only=True):
+    '''yield the nodes that belong to a tag (container). By default we only
+       yield leaves (files), set leaves_only to False to include all nodes.
+
+       Parameters
+       ==========
+       tag: the tag (container) to list nodes for
+       leaves_only: only yield leaf nodes (default True)
+    '''
+    for node in list(_get_postings(self, tag).values()):
+        if not leaves_only or node.leaf:
+            yield node
+
+
+def _diff_tags(self, tag_a, tag_b, leaves_only=True):
+    '''yield the nodes that tag_a has, but tag_b does not. The cost is
+       proportional to the number of nodes for tag_a.
+
+       Parameters
+       ==========
+       tag_a: the tag (container) to yield nodes for
+       tag_b: the tag (container) that must be missing from the nodes
+       leaves_only: only yield leaf nodes (default True)
+    '''
+    for node in self.files_of(tag_a, leaves_only):
+        if tag_b not in node.tags:
+            yield node
+
+
+def intersection(self, tags, leaves_only=True):
+    '''yield the nodes shared by all tags. We iterate over the smallest
+       postings list and check the others against the node tags.
+
+       Parameters
+       ==========
+       tags: a list of tags (containers) that must all be present
+       leaves_only: only yield leaf nodes (default True)
+    '''
+    tags = list(tags)
+    if not tags:
+        return
+
+    postings = [_get_postings(self, tag) for tag in tags]
+    smallest = min(range(len(tags)), key=lambda i: len(postings[i]))
+    others = [t for t in tags if t != tags[smallest]]
+
+    for node in list(postings[smallest].values()):
+        if leaves_only and not node.leaf:
+            continue
+        if all(t in node.tags for t in others):
+            yield node
@@ -0,0 +1,154 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Merkle (subtree) hashes for container trees. Each node lazily computes a
+# hash over its label, some attributes (size, version) and the hashes of its
+# children, so identical subtrees in two trees can be skipped when diffing.
+
+import hashlib
+
+
+def _hash_component(self, label, node, children):
+    '''hash one path component, with the attributes of node and the
+       (digests of the) children.
+    '''
+    digest = hashlib.sha1(label.encode('utf-8'))
+    for attribute in self._hash_attributes:
+        digest.update(b'\0')
+        digest.update(repr(getattr(node, attribute, None)).encode('utf-8'))
+    for child in sorted(children):
+        digest.update(b'\0')
+        digest.update(child)
+    return digest.digest()
+
+
+def subtree_hash(self, node=None):
+    '''return the Merkle hash for a node (default is the root) computing it
+       if it isn't cached. The order of children doesn't matter, and a
+       compressed (radix) node has the same hash as its expanded chain.
+
+       Parameters
+       ==========
+       node: the node to get the hash for (default is the root)
+    '''
+    if node == None:
+        node = self.root
+
+    if node._hash is None:
+        children = [self.subtree_hash(child) for child in node.children]
+        digest = self._hash_component(node.label, node, children)
+        for segment in reversed(node.prefix):
+            digest = self._hash_component(segment, node, [digest])
+        node._hash = digest
+
+    return node._hash
+
+
+def _component_hash(self, node, offset):
+    '''return the Merkle hash for one path component of a node, where offset
+       is the index of the component in the prefix and label (0 is the
+       first). This is the hash of the same node in an expanded tree.
+    '''
+    if offset == 0:
+        return self.subtree_hash(node)
+
+    children = [self.subtree_hash(child) for child in node.children]
+    digest = self._hash_component(node.label, node, children)
+    for segment in reversed(node.prefix[offset:]):
+        digest = self._hash_component(segment, node, [digest])
+    return digest
+
+
+def diff(self, other, tag_b=None, leaves_only=True):
+    '''diff two trees, or two tags of the same tree. Given another tree,
+       yield (status, path) for paths that are only in this tree (removed),
+       only in the other tree (added) or in both with different attributes
+       (changed). Subtrees with the same Merkle hash are skipped, so we
+       only descend where the trees differ. The trees are compared one
+       path component at a time, so a radix tree can be compared with an
+       expanded one, or a radix tree that compressed the paths differently.
+
+       Given two tags, yield the nodes that the first has and the second
+       doesn't (using the tag index).
+
+       Parameters
+       ==========
+       other: the tree to compare to, or the first tag
+       tag_b: if comparing tags, the second tag
+       leaves_only: if comparing tags, only yield leaves, and if comparing
+                    trees only leaves are changed (default True). Folders
+                    take the attributes of the file that created them, so
+                    a folder can differ when only a file under it changed.
+    '''
+    if not hasattr(other, 'root'):
+        return self._diff_tags(other, tag_b, leaves_only)
+    return self._diff_trees(other, leaves_only)
+
+
+def _diff_trees(self, other, leaves_only=True):
+    '''yield (status, path) for the differences between this tree and other.
+       A position in a tree is a (node, offset) for each path component,
+       where offset is the index of the component in the prefix and label
+       of the node (it's always 0 for an expanded tree).
+    '''
+    def component(node, offset):
+        return node.prefix[offset] if offset < len(node.prefix) else node.label
+
+    def children(node, offset):
+        if offset < len(node.prefix):
+            return [(node, offset + 1)]
+        return [(child, 0) for child in node.children]
+
+    def leaf(node, offset):
+        return offset == len(node.prefix) and node.leaf
+
+    def subtree(node, offset, path, status):
+        path = path + self.folder_sep + component(node, offset)
+        yield status, path
+        for child in children(node, offset):
+            for found in subtree(child[0], child[1], path, status):
+                yield found
+
+    def compare(a, b, path):
+        if self._component_hash(*a) == other._component_hash(*b):
+            return
+
+        if path != None:
+            path = path + self.folder_sep + component(*a)
+            if not leaves_only or leaf(*a) or leaf(*b):
+                for attribute in self._hash_attributes:
+                    if getattr(a[0], attribute, None) != getattr(b[0], attribute, None):
+                        yield 'changed', path
+                        break
+        else:
+            path = ''
+
+        matches = dict((component(*child), child) for child in children(*b))
+        for child in children(*a):
+            match = matches.pop(component(*child), None)
+            if match is None:
+                for found in subtree(child[0], child[1], path, 'removed'):
+                    yield found
+            else:
+                for found in compare(child, match, path):
+                    yield found
+
+        for child in matches.values():
+            for found in subtree(child[0], child[1], path, 'added'):
+                yield found
+
+    for found in compare((self.root, 0), (other.root, 0), None):
+        yield found
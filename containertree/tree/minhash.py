@@ -0,0 +1,215 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Approximate similarity for many containers. Each tag (container) gets a
+# MinHash signature over the paths (nodes) it touches, and the signatures
+# are banded into an LSH index, so the nearest containers are found without
+# comparing a container to every other one.
+
+import hashlib
+import struct
+
+
+class MinHashIndex(object):
+
+    def __init__(self, tree, num_perm=128, bands=32, seed=1):
+        '''build MinHash signatures for every tag in a tree, and an LSH index
+           of the signatures. Each signature has num_perm values, split into
+           bands. Two containers are candidates if all values in any band
+           are the same, so more bands find less similar containers (better
+           recall, more candidates), and more values per band find fewer.
+           More values (num_perm) give a more accurate estimate.
+
+           Parameters
+           ==========
+           tree: the ContainerTree (or subclass) to index
+           num_perm: the number of hash functions (values) in a signature
+           bands: the number of LSH bands, should divide num_perm
+           seed: the random seed for the hash functions
+        '''
+        import numpy
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        # The hash functions are multiply-shift, (a * x + b) mod 2^64 >> 32
+        state = numpy.random.RandomState(seed)
+        draw = lambda: state.randint(0, 1 << 32, size=(num_perm, 2),
+                                       dtype=numpy.uint64)
+        self._a = (draw() << numpy.uint64(32) | draw())[:, 0] | numpy.uint64(1)
+        self._b = (draw() << numpy.uint64(32) | draw())[:, 0]
+
+        self.signatures = self._signatures(tree)
+        self.buckets = [{} for band in range(bands)]
+        for tag, signature in self.signatures.items():
+            for band, key in enumerate(self._band_keys(signature)):
+                self.buckets[band].setdefault(key, set()).add(tag)
+
+    def __str__(self):
+        return "MinHashIndex<%s:%sx%s>" % (len(self.signatures), self.bands, self.rows)
+    def __repr__(self):
+        return "MinHashIndex<%s:%sx%s>" % (len(self.signatures), self.bands, self.rows)
+
+
+    def _signatures(self, tree, chunk=4096):
+        '''compute the signature for each tag. We first collect a hash for
+           each node (by path) and the nodes for each tag, in one pass over
+           the tree, and then hash the nodes of each tag in chunks. A
+           compressed (radix) node counts as each of its components, as for
+           the similarity score.
+        '''
+        import numpy
+
+        values = []
+        elements = {}
+
+        def traverse(node, path):
+            for segment in list(node.prefix) + [node.label]:
+                path = path + tree.folder_sep + segment
+                digest = hashlib.sha1(path.encode('utf-8')).digest()
+                for tag in node.tags:
+                    elements.setdefault(tag, []).append(len(values))
+                values.append(struct.unpack('<I', digest[:4])[0])
+
+            for child in node.children:
+                traverse(child, path)
+
+        traverse(tree.root, '')
+        values = numpy.array(values, dtype=numpy.uint64)
+
+        signatures = {}
+        shift = numpy.uint64(32)
+        for tag, indices in elements.items():
+            signature = numpy.full(self.num_perm, 1 << 32, dtype=numpy.uint64)
+            for start in range(0, len(indices), chunk):
+                x = values[indices[start:start + chunk]]
+                hashed = (self._a[:, None] * x[None, :] + self._b[:, None]) >> shift
+                signature = numpy.minimum(signature, hashed.min(axis=1))
+            signatures[tag] = signature
+        return signatures
+
+
+    def _band_keys(self, signature):
+        '''yield the LSH key for each band of a signature'''
+        for band in range(self.bands):
+            yield signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+
+    def similarity(self, tag_a, tag_b):
+        '''estimate the similarity (Jaccard of the nodes) of two tags as the
+           fraction of signature values that are the same.
+        '''
+        return float((self.signatures[tag_a] == self.signatures[tag_b]).mean())
+
+
+    def candidates(self, tag):
+        '''return the set of tags that share at least one band with tag'''
+        found = set()
+        for band, key in enumerate(self._band_keys(self.signatures[tag])):
+            found.update(self.buckets[band].get(key, ()))
+        found.discard(tag)
+        return found
+
+
+    def nearest(self, tag, k=10):
+        '''return up to k (estimated score, tag) for the most similar tags,
+           from the LSH candidates, sorted from most to least similar.
+        '''
+        scores = [(self.similarity(tag, other), other) for other in self.candidates(tag)]
+        scores.sort(key=lambda x: (-x[0], x[1]))
+        return scores[:k]
+
+
+def minhash(self, num_perm=128, bands=32, seed=1):
+    '''build (or rebuild) the MinHash / LSH index for the tags in the tree.
+       The index is built on demand by nearest, and rebuilt after the tree
+       changes, so calling this directly is only needed to change the
+       accuracy. See MinHashIndex for the parameters.
+    '''
+    if bands < 1 or num_perm % bands != 0:
+        print('bands (%s) must divide num_perm (%s)' % (bands, num_perm))
+        return None
+
+    self._minhash = MinHashIndex(self, num_perm=num_perm, bands=bands, seed=seed)
+    return self._minhash
+
+
+def nearest(self, tag, k=10):
+    '''return the k containers (tags) most similar to a tag, as a list of
+       (score, tag) where score estimates similarity_score([tag, other]).
+       The similarity is estimated with MinHash, and only the containers
+       that share an LSH bucket with the tag are considered, so this is
+       approximate. Use check_nearest to measure the accuracy.
+
+       Parameters
+       ==========
+       tag: the tag (container) to find neighbors for
+       k: the number of neighbors to return
+    '''
+    if self._minhash is None:
+        self.minhash()
+
+    if tag not in self._minhash.signatures:
+        print('%s is not a tag in the tree.' % tag)
+        return None
+
+    return self._minhash.nearest(tag, k)
+
+
+def check_nearest(self, tags=None, k=10):
+    '''compare nearest to the exact similarity_score for some tags (default
+       is all) and return the mean absolute error of the estimated scores,
+       and the recall (the fraction of the exact k nearest that are found).
+       This computes all the exact scores for the tags, so use a sample.
+
+       Parameters
+       ==========
+       tags: a list of tags to check (default is all tags)
+       k: the number of neighbors to check
+    '''
+    if self._minhash is None:
+        self.minhash()
+
+    everything = list(self._minhash.signatures)
+    if tags is None:
+        tags = everything
+
+    errors = []
+    found = expected = 0
+
+    for tag in tags:
+        exact = [(self.similarity_score([tag, other])['score'], other)
+                 for other in everything if other != tag]
+        exact.sort(key=lambda x: (-x[0], x[1]))
+        approximate = self.nearest(tag, k)
+
+        scores = dict((other, score) for score, other in exact)
+        for score, other in approximate:
+            errors.append(abs(score - scores[other]))
+
+        # Neighbors tied with the kth exact score are all correct
+        if exact:
+            cutoff = exact[:k][-1][0]
+            correct = set(other for score, other in exact if score >= cutoff)
+            found += min(len(correct.intersection(o for s, o in approximate)),
+                         len(exact[:k]))
+            expected += len(exact[:k])
+
+    return {'error': sum(errors) / float(len(errors)) if errors else 0,
+            'recall': found / float(expected) if expected else 1,
+            'num_perm': self._minhash.num_perm,
+            'bands': self._minhash.bands}
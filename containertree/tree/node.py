@@ -15,9 +15,33 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
+import weakref
+
+try:
+    from sys import intern
+except ImportError:
+    pass # Python 2 has intern as a builtin
 
 class Node(object):
-    
+
+    # Attributes that describe the structure, and aren't exported
+    _structure = ('children',)
+
+    # A plain node is a single path component (see RadixNode)
+    prefix = ()
+
+    # The (Merkle) subtree hash, computed lazily by the tree
+    _hash = None
+
+    # The parent node (and tag of the parent) in a CollectionTree
+    _parent = None
+    _parent_tag = None
+
+    # The number of nodes under the node in a CollectionTree, and under each
+    # tag of a MultiNode (a dictionary, created when a tag has children)
+    _descendants = 0
+    _tag_descendants = None
+
     def __init__(self, name, attrs, tag=None):
         ''' a Node is a node in the Trie, meaning that
             it stores a word (a folder, name, or file) and some
@@ -70,7 +94,7 @@ class Node(object):
         '''return all attributes of the node (aside from children)'''
         ats = {} 
         for key, val in self.__dict__.items():
-            if key !="children":
+            if key not in self._structure and not key.startswith('_'):
                 if isinstance(val, set):
                     val = list(val)
                 ats[key] = val
@@ -97,30 +121,345 @@ class Node(object):
         for child in self.children:
             yield child
 
+    def invalidate(self):
+        '''clear the cached subtree hash, when the node or a child changes'''
+        self._hash = None
+
+    def get_chain(self):
+        '''return the list of path components that the node represents. For
+           a plain Node, this is just the node itself.
+        '''
+        return [self]
+
+
+class RadixNode(Node):
+    '''a RadixNode is a Node that represents an unbranched chain of path
+       components (e.g., usr/share/doc) as one edge of a path compressed
+       tree. The label is the last component, and the components before it
+       are kept in order in prefix. All components in the chain share
+       the same tags, counter and attributes, and only the last can be a leaf.
+    '''
+    _structure = ('children', 'prefix')
+
+    def __init__(self, name, attrs, prefix=None, tag=None):
+        super(RadixNode, self).__init__(name, attrs, tag=tag)
+        self.prefix = list(prefix or [])
+
+    def __str__(self):
+        return "RadixNode<%s>" % '/'.join(self.get_segments())
+    def __repr__(self):
+        return "RadixNode<%s>" % '/'.join(self.get_segments())
+
+    def get_segments(self):
+        '''return all path components of the edge, in order'''
+        return self.prefix + [self.label]
+
+    def get_chain(self):
+        '''return the chain of nodes that an expanded tree would have for the
+           edge. The components in the prefix are returned as (detached)
+           plain nodes that share the attributes of the edge, and the
+           last component is the RadixNode itself.
+        '''
+        chain = []
+        for segment in self.prefix:
+            node = Node(segment, {})
+            for key, val in self.__dict__.items():
+                if key not in self._structure and not key.startswith('_'):
+                    node.__dict__[key] = val
+            node.label = segment
+            node.leaf = False
+            node.tags = set(self.tags)
+            chain.append(node)
+        return chain + [self]
+
 
 class MultiNode(Node):
     '''a MultiNode is intended to hold multiple sets of children, indexed by
        the tag. This is intended for a Collection, where each single node
        is a container namespace (e.g., library/ubuntu) and the keys are
-       tags, and each tag is associated with a list of children.
+       tags, and each tag is associated with a list of children (see
+       TagChildren).
     '''
      
     def __init__(self, name, attrs, tag=None):
         super(MultiNode, self).__init__(name, attrs, tag=None)
-        self.children = {}
+        self.children = TagChildren()
+
+        # Set in a CollectionTree, here so all nodes have the same attributes
+        self._parent = None
+        self._parent_tag = None
+        self._descendants = 0
+        self._tag_descendants = None
 
     def __str__(self):
         return "MultiNode<%s>" % self.label
     def __repr__(self):
         return "MultiNode<%s>" % self.label
 
+    def __setstate__(self, state):
+        '''children were a dictionary of lists (by tag) in older pickles'''
+        self.__dict__.update(state)
+        if isinstance(self.children, dict):
+            self.children = TagChildren(self.children)
+
     def get_children(self):
-        '''a helper function to get children for a node. This helps the user
-           because the we need to loop over a dictionary. This isn't an iterator
-           because it's expected that a node have a reasonably small number
-           of children.
+        '''a helper function to get children for a node, for all tags (in
+           the order of the tags).
         '''
-        children = []
-        for child_tag in self.children:
-            for child in self.children[child_tag]:
-                yield child
+        return iter(self.children.nodes())
+
+
+def _intern(tag):
+    '''intern a tag, Python 2 can't intern unicode so it's kept as is'''
+    try:
+        return intern(tag)
+    except TypeError:
+        return tag
+
+
+class _Tags(object):
+    '''a tuple of tags that nodes with the same tags share (see _share_tags)'''
+    __slots__ = ('tags', '__weakref__')
+
+    def __init__(self, tags):
+        self.tags = tags
+
+
+# Tags by tuple, for as long as a node has them
+_shared = weakref.WeakValueDictionary()
+_no_tags = _Tags(())
+
+def _share_tags(tags):
+    '''return the _Tags for a tuple of tags, shared with other nodes'''
+    if not tags:
+        return _no_tags
+    shared = _shared.get(tags)
+    if shared is None:
+        shared = _shared[tags] = _Tags(tags)
+    return shared
+
+
+class TagChildren(object):
+    '''the children of a MultiNode, by tag, with the same interface as a
+       dictionary of lists (children[tag].append(node), tag in children,
+       children.items(), etc.) For many containers, a dictionary and list
+       for each node is a lot of memory, so instead we keep the tags
+       (interned, in the order added), one list of the children, sorted
+       by tag, and a list of where the children of each tag end in it
+       (None while there are no children). The children for a tag are a
+       slice of the list. The same tuples of tags are shared between nodes.
+    '''
+    __slots__ = ('_tags', '_ends', '_nodes')
+
+    def __init__(self, children=None):
+        self._tags = _no_tags
+        self._ends = None
+        self._nodes = None
+        if children:
+            for tag, nodes in children.items():
+                self[tag] = nodes
+
+    def __getstate__(self):
+        ends = self._ends or [0] * len(self._tags.tags)
+        return (self._tags.tags, tuple(ends), self._nodes)
+
+    def __setstate__(self, state):
+        tags, ends, self._nodes = state
+        self._tags = _share_tags(tuple(_intern(tag) for tag in tags))
+        self._ends = list(ends) if self._nodes else None
+
+    def __repr__(self):
+        return repr(dict(self._groups()))
+
+    def __len__(self):
+        return len(self._tags.tags)
+
+    def __iter__(self):
+        return iter(self._tags.tags)
+
+    def __contains__(self, tag):
+        return tag in self._tags.tags
+
+    def __eq__(self, other):
+        if isinstance(other, TagChildren):
+            other = dict(other._groups())
+        return dict(self._groups()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+    def __getitem__(self, tag):
+        if tag not in self._tags.tags:
+            raise KeyError(tag)
+        return TagList(self, tag)
+
+    def __setitem__(self, tag, nodes):
+        '''set the children for a tag (replacing any children it had)'''
+        nodes = list(nodes)
+        if tag in self._tags.tags:
+            index = self._tags.tags.index(tag)
+            start, end = self._range(index)
+            if start < end:
+                del self._nodes[start:end]
+                self._shift(index, start - end)
+        else:
+            self._tags = _share_tags(self._tags.tags + (_intern(tag),))
+            if self._ends is not None:
+                self._ends.append(self._ends[-1])
+        for node in nodes:
+            self._append(tag, node)
+
+    def __delitem__(self, tag):
+        self.pop(tag)
+
+
+    def _range(self, index):
+        '''return the (start, end) slice of the children for a tag number'''
+        if self._ends is None:
+            return (0, 0)
+        return (self._ends[index - 1] if index else 0, self._ends[index])
+
+    def _shift(self, index, count):
+        '''add a count to where the children end, from a tag number on'''
+        if not self._nodes:
+            self._ends = None
+            return
+        if self._ends is None:
+            self._ends = [0] * len(self._tags.tags)
+        ends = self._ends
+        for position in range(index, len(ends)):
+            ends[position] += count
+
+    def _append(self, tag, node):
+        '''add a child at the end of the children for a tag'''
+        index = self._tags.tags.index(tag)
+        if self._nodes is None:
+            self._nodes = []
+        self._nodes.insert(self._range(index)[1], node)
+        self._shift(index, 1)
+
+    def _remove(self, tag, node):
+        '''remove a child (the same node) from the children for a tag'''
+        index = self._tags.tags.index(tag)
+        start, end = self._range(index)
+        for position in range(start, end):
+            if self._nodes[position] is node:
+                del self._nodes[position]
+                self._shift(index, -1)
+                return
+        raise ValueError('%s is not a child for %s' % (node, tag))
+
+    def _get(self, tag):
+        '''return a list of the children for a tag'''
+        start, end = self._range(self._tags.tags.index(tag))
+        return self._nodes[start:end] if start < end else []
+
+    def _groups(self):
+        '''yield (tag, children) for each tag in order, in one pass'''
+        if self._ends is None:
+            for tag in self._tags.tags:
+                yield (tag, [])
+            return
+        start = 0
+        for tag, end in zip(self._tags.tags, self._ends):
+            yield (tag, self._nodes[start:end] if start < end else [])
+            start = end
+
+
+    def nodes(self):
+        '''return the children for all tags (in the order of the tags)'''
+        return self._nodes if self._nodes is not None else []
+
+    def keys(self):
+        return list(self._tags.tags)
+
+    def values(self):
+        return [TagList(self, tag) for tag in self._tags.tags]
+
+    def items(self):
+        return [(tag, TagList(self, tag)) for tag in self._tags.tags]
+
+    def get(self, tag, default=None):
+        if tag in self._tags.tags:
+            return TagList(self, tag)
+        return default
+
+    def setdefault(self, tag, default=None):
+        if tag not in self._tags.tags:
+            self[tag] = default or []
+        return TagList(self, tag)
+
+    def pop(self, tag, *default):
+        '''remove a tag, and return a list of its children'''
+        tags = self._tags.tags
+        if tag not in tags:
+            if default:
+                return default[0]
+            raise KeyError(tag)
+
+        index = tags.index(tag)
+        start, end = self._range(index)
+        nodes = self._nodes[start:end] if start < end else []
+        if start < end:
+            del self._nodes[start:end]
+            self._shift(index, start - end)
+
+        self._tags = _share_tags(tags[:index] + tags[index + 1:])
+        if self._ends is not None:
+            del self._ends[index]
+        return nodes
+
+
+class TagList(object):
+    '''the children of one tag of a MultiNode, with the interface of a list
+       (append, remove, len, indexing, in). Changes go to the TagChildren.
+    '''
+    __slots__ = ('_children', '_tag')
+
+    def __init__(self, children, tag):
+        self._children = children
+        self._tag = tag
+
+    def __repr__(self):
+        return repr(self._children._get(self._tag))
+
+    def __len__(self):
+        return len(self._children._get(self._tag))
+
+    def __iter__(self):
+        return iter(self._children._get(self._tag))
+
+    def __getitem__(self, index):
+        return self._children._get(self._tag)[index]
+
+    def __contains__(self, node):
+        return any(child is node for child in self._children._get(self._tag))
+
+    def __eq__(self, other):
+        if isinstance(other, TagList):
+            other = list(other)
+        return self._children._get(self._tag) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def append(self, node):
+        self._children._append(self._tag, node)
+
+    def extend(self, nodes):
+        for node in nodes:
+            self._children._append(self._tag, node)
+
+    def remove(self, node):
+        self._children._remove(self._tag, node)
+
+    def index(self, node):
+        return self._children._get(self._tag).index(node)
+
+    def count(self, node):
+        return sum(1 for child in self._children._get(self._tag) if child is node)
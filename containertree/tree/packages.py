@@ -0,0 +1,98 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Package version index functions for a ContainerPackageTree. The index maps
+# each package name to its versions, sorted by a parsed version key (Debian
+# or PEP 440 ordering), so version range queries use a binary search.
+
+from bisect import bisect_left, bisect_right
+
+
+def index_packages(self):
+    '''build an index of package name -> (version keys, version nodes) with
+       the versions sorted by key, and keep it updated for subsequent calls
+       to _make_tree (insert, update). The index is built on demand by
+       versions_of and containers_with. Since the nodes are kept, the tags
+       (containers) for a version are always current.
+    '''
+    self._package_index = {}
+    for package in self.root.children:
+        for version in package.children:
+            self._index_version(package.label, version)
+    return self._package_index
+
+
+def _index_version(self, name, node):
+    '''add a version node for a package name to the index'''
+    keys, nodes = self._package_index.setdefault(name, ([], []))
+    key = self._version_key(node.label)
+    position = bisect_right(keys, key)
+    keys.insert(position, key)
+    nodes.insert(position, node)
+
+
+def versions_of(self, name, lower=None, upper=None,
+                            include_lower=True, include_upper=False):
+    '''return the version nodes for a package, sorted from oldest to newest,
+       optionally in a range of versions. By default the range includes the
+       lower version and excludes the upper, so lower='1.1.0', upper='1.1.1'
+       are the 1.1.0 versions.
+
+       Parameters
+       ==========
+       name: the name of the package, e.g., openssl
+       lower: if defined, the lowest version to include
+       upper: if defined, the highest version to include
+       include_lower: include versions equal to lower (default True)
+       include_upper: include versions equal to upper (default False)
+    '''
+    if self._package_index is None:
+        self.index_packages()
+
+    keys, nodes = self._package_index.get(name, ([], []))
+
+    start = 0
+    if lower is not None:
+        search = bisect_left if include_lower else bisect_right
+        start = search(keys, self._version_key(lower))
+
+    end = len(keys)
+    if upper is not None:
+        search = bisect_right if include_upper else bisect_left
+        end = search(keys, self._version_key(upper))
+
+    return nodes[start:end]
+
+
+def containers_with(self, name, lower=None, upper=None,
+                                include_lower=True, include_upper=False):
+    '''return the set of tags (containers) that have a package, optionally
+       with a version in a range. For example, the containers with
+       openssl older than 1.1.1 are containers_with('openssl', upper='1.1.1')
+
+       Parameters
+       ==========
+       name: the name of the package, e.g., openssl
+       lower: if defined, the lowest version to include
+       upper: if defined, the highest version to include
+       include_lower: include versions equal to lower (default True)
+       include_upper: include versions equal to upper (default False)
+    '''
+    tags = set()
+    for node in self.versions_of(name, lower, upper,
+                                 include_lower, include_upper):
+        tags.update(node.tags)
+    return tags
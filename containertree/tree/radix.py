@@ -0,0 +1,201 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Radix (path compressed) tree functions for a ContainerFileTree. An
+# unbranched chain of path components is stored as a single RadixNode,
+# and the chain is split lazily when a new sibling (or tag) arrives.
+
+import re
+from .node import RadixNode
+from .rollup import _rollup_inherit
+
+
+def _split_path(self, filepath):
+    '''split a filepath into components for the radix tree. The expanded
+       tree never adds a child with the same label as its parent (/a/a
+       is stored as /a) so we collapse repeated components the same way.
+    '''
+    components = []
+    for component in filepath.split(self.folder_sep):
+        if component and (not components or components[-1] != component):
+            components.append(component)
+    return components
+
+
+def _radix_child(self, node, component):
+    '''return the child of node whose edge starts with component, or None.
+       The index in the children list is returned too, for splitting.
+    '''
+    for index, child in enumerate(node.children):
+        first = child.prefix[0] if child.prefix else child.label
+        if first == component:
+            return index, child
+    return None, None
+
+
+def _split_radix(self, parent, index, length):
+    '''split the child of parent at index so that the first length
+       components become a new (head) node, with the rest of the edge as
+       its only child. The head shares the attributes of the edge.
+    '''
+    child = parent.children[index]
+    segments = child.get_segments()
+
+    head = RadixNode(segments[length - 1], {}, prefix=segments[:length - 1])
+    for key, val in child.__dict__.items():
+        if key not in child._structure + ('label', 'tags', 'leaf'):
+            if not key.startswith('_'):
+                head.__dict__[key] = val
+    head.children = [child]
+
+    child.prefix = segments[length:-1]
+    child.invalidate()
+    parent.children[index] = head
+    self.count += 1
+
+    for tag in child.tags:
+        self._tag_node(head, tag)
+
+    if self._rollups:
+        _rollup_inherit(head, child)
+    return head
+
+
+def _make_radix_tree(self, data=None, tag=None):
+    '''construct a radix tree from the loaded data (self.data). The result
+       has the same paths, tags and counts as the tree from _make_tree,
+       but unbranched chains of components are one RadixNode.
+    '''
+    if data is None:
+        data = self.data
+
+    for attrs in data:
+
+        node = self.root
+        path = [node]
+        self._tag_node(node, tag)
+
+        components = self._split_path(attrs['Name'])
+        i = 0
+
+        while i < len(components):
+
+            index, child = self._radix_child(node, components[i])
+
+            # Not found, the rest of the path is one new edge
+            if child is None:
+                child = RadixNode(components[-1], attrs, prefix=components[i:-1])
+                self.count += 1
+                node.children.append(child)
+                self._tag_node(child, tag)
+                path.append(child)
+                node = child
+                break
+
+            # How much of the edge do we share?
+            segments = child.get_segments()
+            length = 1
+            while (length < len(segments) and i + length < len(components)
+                   and segments[length] == components[i + length]):
+                length += 1
+
+            # We diverge (or stop) inside the edge, split it
+            if length < len(segments):
+                child = self._split_radix(node, index, length)
+
+            # Did we find an existing node?
+            if attrs['Name'] == child.name:
+                child.counter += 1
+
+            self._tag_node(child, tag)
+            path.append(child)
+            node = child
+            i += length
+
+        # The last in the list is the leaf (file)
+        node.leaf = True
+        self._touch_path(path, tag)
+
+
+def _find_radix(self, filepath):
+    '''find a path in a radix tree and return the node if found. Like find,
+       we expect the absolute filepath. The node returned is the edge that
+       ends with the path, which shares the name, tags and counter of
+       each component in the chain.
+    '''
+    node = self.root
+
+    if len(node.children) == 0:
+        if node.label == filepath:
+            return node
+        return
+
+    assembled = '/'.join(filepath.split(self.folder_sep))
+    components = self._split_path(filepath)
+    i = 0
+
+    while i < len(components):
+        index, child = self._radix_child(node, components[i])
+        if child is None:
+            return
+
+        segments = child.get_segments()
+        if components[i:i + len(segments)] != segments:
+            return
+
+        node = child
+        i += len(segments)
+
+    # The name is that of the entry that created the node
+    if node.name == assembled:
+        return node
+
+
+def _search_radix(self, name, number=None):
+    '''find a basename in a radix tree, visiting the components in the same
+       order (and stopping at the same number) as search on an expanded
+       tree. Components in the prefix of an edge are returned as
+       (detached) plain nodes, as get_chain does.
+    '''
+    def search(chain, position):
+        found = []
+        link = chain[position]
+
+        # Look for the name in the current component
+        if re.search(name, link.label):
+            found.append(link)
+
+        # The next component, or the children at the end of the edge
+        if position < len(chain) - 1:
+            children = [(chain, position + 1)]
+        else:
+            children = [(child.get_chain(), 0) for child in link.children]
+
+        if len(children) == 0:
+            return found
+
+        if number != None:
+            if len(found) >= number:
+                return found
+
+        for chain, position in children:
+            found += search(chain, position)
+            if number != None:
+                if len(found) >= number:
+                    return found
+        return found
+
+    return search(self.root.get_chain(), 0)
@@ -0,0 +1,81 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A ranking of keys by count, that is updated as the counts change. The keys
+# are kept in a bucket (set) for each count, with a sorted list of the counts
+# that have keys, so the top k keys are read from the largest count down.
+
+from bisect import ( bisect_left, insort )
+
+
+class Ranking(object):
+
+    def __init__(self):
+        '''a ranking of keys (e.g., container names) by a count, where a
+           key with a count of 0 isn't ranked. Changing the count for a key
+           moves it to another bucket, and only adds (or removes) a count in
+           the sorted list of counts when a bucket is new (or empty).
+        '''
+        self.counts = {}
+        self.buckets = {}
+        self.sorted = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def set(self, key, count):
+        '''set the count for a key, and move it to the bucket for the count.
+           A count of 0 (or less) removes the key.
+        '''
+        previous = self.counts.get(key, 0)
+        if previous == count:
+            return
+
+        if previous > 0:
+            self.discard(key)
+
+        if count > 0:
+            self.counts[key] = count
+            bucket = self.buckets.get(count)
+            if bucket is None:
+                bucket = self.buckets[count] = set()
+                insort(self.sorted, count)
+            bucket.add(key)
+
+    def discard(self, key):
+        '''remove a key from the ranking, if it's there'''
+        count = self.counts.pop(key, None)
+        if count is None:
+            return
+
+        bucket = self.buckets[count]
+        bucket.discard(key)
+        if not bucket:
+            del self.buckets[count]
+            del self.sorted[bisect_left(self.sorted, count)]
+
+    def top(self, k):
+        '''return the k keys with the largest counts, as a list of (key,
+           count) from largest to smallest. Keys with the same count are
+           in no particular order.
+        '''
+        ranked = []
+        for count in reversed(self.sorted):
+            for key in self.buckets[count]:
+                if len(ranked) >= k:
+                    return ranked
+                ranked.append((key, count))
+        return ranked
@@ -0,0 +1,208 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Subtree size rollups for a ContainerFileTree. Once enabled with rollup(),
+# every node keeps the total size and number of files under it (and the
+# total size per tag) and the totals are updated on insert and remove.
+
+
+def _is_file(node):
+    '''a file is a node that was added (a leaf) without children. Folders
+       are usually added too, but they have children.
+    '''
+    return node.leaf and not node.children
+
+
+def _get_size(node):
+    return getattr(node, 'size', 0) or 0
+
+
+def _rollup_reset(node):
+    '''start the rollup totals for a node at zero'''
+    node._du_size = 0
+    node._du_files = 0
+    node._du_tags = {}
+    node._du_file = False
+    node._du_ntags = 0
+
+
+def _rollup_inherit(head, child):
+    '''a new (radix) node that has child as its only child has the same
+       totals as the child, minus the child being a file itself.
+    '''
+    _rollup_reset(head)
+    _rollup_add([head], child._du_size, child._du_files, [])
+    _rollup_tags([head], child._du_tags)
+
+
+def _rollup_add(path, size, files, tags):
+    '''add a size and file count (and the size for each of tags) to all
+       nodes in path. A negative size and count subtract.
+    '''
+    for node in path:
+        node._du_size += size
+        node._du_files += files
+    _rollup_tags(path, dict((tag, size) for tag in tags))
+
+
+def _rollup_tags(path, sizes):
+    '''add a size per tag (a dictionary) to all nodes in path'''
+    for node in path:
+        for tag, size in sizes.items():
+            total = node._du_tags.get(tag, 0) + size
+            if total:
+                node._du_tags[tag] = total
+            else:
+                node._du_tags.pop(tag, None)
+
+
+def rollup(self):
+    '''compute the total size, file count and size per tag for every node in
+       the tree, and keep them updated for subsequent inserts and removes.
+       Use du to query the totals.
+    '''
+    def traverse(node):
+        _rollup_reset(node)
+        for child in node.children:
+            traverse(child)
+            _rollup_add([node], child._du_size, child._du_files, [])
+            _rollup_tags([node], child._du_tags)
+
+        if _is_file(node):
+            _rollup_add([node], _get_size(node), 1, node.tags)
+            node._du_file = True
+            node._du_ntags = len(node.tags)
+
+    traverse(self.root)
+    self._rollups = True
+
+
+def _rollup_path(self, path, tag=None, removed=None):
+    '''update the rollups after an insert along path (where tag was added)
+       or after removed was taken from the last node in path. Only the
+       end of the path can become a file, and only a node that got a new
+       child (or lost one) can change, so this is proportional to the depth.
+    '''
+    if removed is not None and '_du_size' in removed.__dict__:
+        _rollup_add(path, -removed._du_size, -removed._du_files, [])
+        _rollup_tags(path, dict((t, -size) for t, size in removed._du_tags.items()))
+
+    for i, node in enumerate(path):
+
+        if '_du_size' not in node.__dict__:
+            _rollup_reset(node)
+
+        is_file = _is_file(node)
+
+        # The node is a new file
+        if is_file and not node._du_file:
+            _rollup_add(path[:i + 1], _get_size(node), 1, node.tags)
+
+        # The node was a file, but now has children. The tag being added
+        # wasn't counted yet if the node has more tags than we counted.
+        elif node._du_file and not is_file:
+            tags = node.tags
+            if len(tags) > node._du_ntags:
+                tags = [t for t in tags if t != tag]
+            _rollup_add(path[:i + 1], -_get_size(node), -1, tags)
+
+        # The node is (still) a file, with a new tag
+        elif is_file and len(node.tags) > node._du_ntags and tag in node.tags:
+            _rollup_tags(path[:i + 1], {tag: _get_size(node)})
+
+        node._du_file = is_file
+        node._du_ntags = len(node.tags)
+
+
+def _find_rollup(self, filepath):
+    '''find the node (edge, for a radix tree) that holds the rollup for a
+       filepath, and the position of the path in the edge. Unlike find, we
+       follow the labels of the path, so we also find folders that were
+       only created as parents.
+    '''
+    node, position = self.root, 0
+
+    for component in self._split_path(filepath):
+        segments = list(node.prefix) + [node.label]
+
+        # We are inside a radix edge
+        if position < len(segments) - 1:
+            if segments[position + 1] != component:
+                return None
+            position += 1
+            continue
+
+        for child in node.children:
+            first = child.prefix[0] if child.prefix else child.label
+            if first == component:
+                node, position = child, 0
+                break
+        else:
+            return None
+
+    return node, position
+
+
+def du(self, filepath='/', depth=0, tag=None):
+    '''return the disk usage for a filepath, and optionally for the folders
+       under it, to some depth (like du --max-depth). This uses the rollup
+       totals, so we don't need to traverse the subtree. A list of entries
+       is returned, with the path first, each a dictionary with the path,
+       total size, number of files, and size per tag.
+
+       Parameters
+       ==========
+       filepath: the path (folder) to get the disk usage for (default /)
+       depth: the number of levels of folders under the path to include
+       tag: if defined, the size is only for the tag (container)
+    '''
+    if not self._rollups:
+        self.rollup()
+
+    found = self._find_rollup(filepath)
+    if found is None:
+        return []
+
+    results = []
+
+    # The components of a radix node share the totals of the node
+    def traverse(node, position, path, level):
+        size = node._du_size
+        if tag is not None:
+            size = node._du_tags.get(tag, 0)
+
+        results.append({'path': path or self.folder_sep,
+                        'size': size,
+                        'files': node._du_files,
+                        'tags': dict(node._du_tags)})
+
+        if level >= depth:
+            return
+
+        if position < len(node.prefix):
+            children = [(node, position + 1)]
+        else:
+            children = [(child, 0) for child in node.children]
+
+        for child, index in children:
+            if tag is not None and tag not in child.tags:
+                continue
+            label = (list(child.prefix) + [child.label])[index]
+            traverse(child, index, path + self.folder_sep + label, level + 1)
+
+    path = self.folder_sep.join([''] + self._split_path(filepath))
+    traverse(found[0], found[1], path, 0)
+    return results
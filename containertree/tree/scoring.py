@@ -0,0 +1,384 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# All-vs-all similarity scores for many containers, split into square tiles
+# of pairs. Tiles are independent, so they can run in a local process pool or
+# as batch (e.g., SLURM) jobs. Each finished tile is saved to its own file,
+# so an interrupted run picks up where it stopped, and the tiles are merged
+# into the tiled heatmap export (export_tiles) one block of rows at a time.
+
+from .similarity import ( _check_weight, _similarity_block )
+from .cluster import _write_tiles
+import hashlib
+import pickle
+import json
+import sys
+import os
+
+# Each worker process loads the database and incidence once, by outdir
+_workers = {}
+
+
+class PairwiseScores(object):
+
+    def __init__(self, outdir):
+        '''load a scoring plan (written by PairwiseScores.plan, or by
+           tree.score_pairs) from an output folder. The folder has the
+           plan (plan.json), the tree (database.pkl) and a folder of
+           results, one file per finished tile.
+
+           Parameters
+           ==========
+           outdir: the output folder with the plan
+        '''
+        self.outdir = os.path.abspath(outdir)
+        with open(os.path.join(self.outdir, 'plan.json'), 'r') as filey:
+            plan = json.loads(filey.read())
+
+        self.tags = plan['tags']
+        self.weight = plan['weight']
+        self.tile = plan['tile']
+        self.tiles = [tuple(t) for t in plan['tiles']]
+        self.database = plan['database']
+
+        # Older plans don't have the hash of the tree
+        self.tree = plan.get('tree')
+
+    def __str__(self):
+        return "PairwiseScores<%s:%s/%s>" % (len(self.tags), len(self.done()), len(self.tiles))
+    def __repr__(self):
+        return "PairwiseScores<%s:%s/%s>" % (len(self.tags), len(self.done()), len(self.tiles))
+
+
+    @classmethod
+    def plan(cls, tree, outdir, tags=None, weight=None, tile=1024, database=None):
+        '''split the pairs of tags into square tiles, and write the plan to
+           an output folder. Since the scores are symmetric, we only plan
+           tiles on or above the diagonal. All tiles (aside from the last
+           row and column) have the same size, so they take about the same
+           time. The tree is saved to database.pkl in the folder, unless a
+           database (pickle) is provided.
+
+           Parameters
+           ==========
+           tree: the ContainerTree (or subclass) to score
+           outdir: the output folder for the plan, database and results
+           tags: a list of tags to score (default is all tags)
+           weight: weight nodes by None (count), size, depth, or idf
+           tile: the number of tags (rows and columns) in each tile
+           database: the path to an existing pickle of the tree
+        '''
+        if not _check_weight(weight):
+            return None
+
+        if tags is None:
+            tags = sorted(tree.root.tags)
+        tags = list(tags)
+
+        outdir = os.path.abspath(outdir)
+        results = os.path.join(outdir, 'results')
+        if not os.path.exists(results):
+            os.makedirs(results)
+
+        if database is None:
+            database = os.path.join(outdir, 'database.pkl')
+            with open(database, 'wb') as filey:
+                pickle.dump(tree, filey)
+
+        starts = range(0, len(tags), tile)
+        tiles = [(r, min(r + tile, len(tags)), c, min(c + tile, len(tags)))
+                 for r in starts for c in starts if c >= r]
+
+        plan = {'tags': tags,
+                'weight': weight,
+                'tile': tile,
+                'tiles': tiles,
+                'database': os.path.abspath(database),
+                'tree': _tree_hash(tree)}
+
+        with open(os.path.join(outdir, 'plan.json'), 'w') as filey:
+            filey.writelines(json.dumps(plan))
+
+        scores = cls(outdir)
+        _workers[scores.outdir] = _worker_state(scores, tree)
+        return scores
+
+
+    def check(self, tree):
+        '''return True if the tree is the tree the plan was written for, so
+           tiles (or a merge) from a checkpoint aren't mixed with another
+           tree. If not, a message is printed and False is returned.
+
+           Parameters
+           ==========
+           tree: the ContainerTree (or subclass) to check
+        '''
+        if self.tree is not None and self.tree != _tree_hash(tree):
+            print('The tree does not match the plan in %s, use another folder.'
+                  % self.outdir)
+            return False
+        return True
+
+
+    def _result(self, index):
+        return os.path.join(self.outdir, 'results', 'tile-%s.npy' % index)
+
+
+    def done(self):
+        '''return the indices of the tiles that are finished'''
+        return [i for i in range(len(self.tiles)) if os.path.exists(self._result(i))]
+
+
+    def pending(self):
+        '''return the indices of the tiles that aren't finished'''
+        return [i for i in range(len(self.tiles)) if not os.path.exists(self._result(i))]
+
+
+    def run(self, tiles=None, workers=1):
+        '''score tiles that aren't finished yet, in this process or a pool
+           of worker processes, and return the indices that were scored. A
+           finished tile is skipped, so running again resumes an
+           interrupted run. Tiles aren't scored if the database isn't
+           the tree the plan was written for.
+
+           Parameters
+           ==========
+           tiles: a list of tile indices to score (default is all)
+           workers: the number of processes to use
+        '''
+        if tiles is None:
+            tiles = range(len(self.tiles))
+        tiles = [i for i in tiles if not os.path.exists(self._result(i))]
+
+        if workers <= 1 or len(tiles) <= 1:
+            scored = [_score_tile(self.outdir, index) for index in tiles]
+            return [index for index in scored if index is not None]
+
+        from multiprocessing import Pool
+        pool = Pool(workers)
+        scored = []
+        try:
+            for index in pool.imap_unordered(_score_tile_worker,
+                                             [(self.outdir, i) for i in tiles]):
+                if index is not None:
+                    scored.append(index)
+        finally:
+            pool.close()
+            pool.join()
+        return sorted(scored)
+
+
+    def write_jobs(self, jobs=None, header=None, command=None):
+        '''write a batch job script for each group of tiles, and a script
+           (run_jobs.sh) to submit them all. Each job runs the containertree
+           score command for its tiles, and skips tiles that are finished,
+           so failed jobs can be submitted again. The scripts are written
+           to the jobs folder in the output folder, and a list of them is
+           returned.
+
+           Parameters
+           ==========
+           jobs: the number of jobs (default is one per tile)
+           header: lines for the top of each job file, where {name} is the
+                   job name and {jobs} the jobs folder (default is SLURM)
+           command: the command to submit a job (default is sbatch)
+        '''
+        if header is None:
+            header = ['#SBATCH --job-name={name}',
+                      '#SBATCH --output={jobs}/{name}.out',
+                      '#SBATCH --error={jobs}/{name}.err',
+                      '#SBATCH --time=60:00',
+                      '#SBATCH --mem=8000']
+
+        if command is None:
+            command = 'sbatch'
+
+        folder = os.path.join(self.outdir, 'jobs')
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        tiles = list(range(len(self.tiles)))
+        jobs = min(jobs or len(tiles), len(tiles))
+
+        scripts = []
+        for job in range(jobs):
+            group = tiles[job::jobs]
+            name = 'containertree_%s' % job
+            script = os.path.join(folder, 'run_%s.sh' % job)
+            with open(script, 'w') as filey:
+                filey.writelines('#!/bin/bash\n')
+                for line in header:
+                    filey.writelines(line.format(name=name, jobs=folder) + '\n')
+                filey.writelines('%s -m containertree.client score %s --tiles %s\n'
+                                 % (sys.executable, self.outdir,
+                                    ','.join(str(i) for i in group)))
+            scripts.append(script)
+
+        with open(os.path.join(folder, 'run_jobs.sh'), 'w') as filey:
+            filey.writelines('#!/bin/bash\n')
+            for script in scripts:
+                filey.writelines('%s %s\n' % (command, script))
+
+        return scripts
+
+
+    def row_blocks(self):
+        '''yield the scores for each block of rows (tile rows of all tags)
+           in order, from the finished tiles. Tiles below the diagonal are
+           the transpose of the tiles above it, so each tile is read twice,
+           and we only keep one block of rows in memory.
+        '''
+        import numpy
+
+        count = len(self.tags)
+        lookup = dict(((t[0], t[2]), i) for i, t in enumerate(self.tiles))
+
+        for start in range(0, count, self.tile):
+            end = min(start + self.tile, count)
+            block = numpy.empty((end - start, count), dtype=numpy.float32)
+            for column in range(0, count, self.tile):
+                if column >= start:
+                    scores = numpy.load(self._result(lookup[(start, column)]))
+                else:
+                    scores = numpy.load(self._result(lookup[(column, start)])).T
+                block[:, column:column + scores.shape[1]] = scores
+            yield block
+
+
+    def merge(self, outdir=None, overview=512):
+        '''merge the finished tiles into the tiled heatmap export (see
+           export_tiles) in one pass, one block of rows at a time. All
+           tiles must be finished. The manifest file is returned.
+
+           Parameters
+           ==========
+           outdir: the folder to export to (default is heatmap in the
+                   output folder)
+           overview: the (maximum) number of rows and columns in the overview
+        '''
+        pending = self.pending()
+        if pending:
+            print('%s tiles are not finished, run them first.' % len(pending))
+            return None
+
+        if outdir is None:
+            outdir = os.path.join(self.outdir, 'heatmap')
+
+        return _write_tiles(outdir, self.tags, self.row_blocks(),
+                            self.tile, overview, self.weight)
+
+
+def _tree_hash(tree):
+    '''return a hash of the tree for a plan, from the Merkle hash (paths
+       and attributes) and the tags of each node, which it doesn't include.
+    '''
+    digest = hashlib.sha1(tree.subtree_hash())
+    nodes = [tree.root]
+    while nodes:
+        node = nodes.pop()
+        digest.update(b'\0')
+        digest.update(node.label.encode('utf-8'))
+        for tag in sorted(node.tags):
+            digest.update(b'\1')
+            digest.update(tag.encode('utf-8'))
+        nodes.extend(sorted(node.children, key=lambda child: child.label))
+    return digest.hexdigest()
+
+
+def _worker_state(scores, tree=None):
+    '''load the tree (if not provided) and calculate the incidence matrix
+       that all tiles for a plan use. None is returned if the database
+       isn't the tree the plan was written for.
+    '''
+    if tree is None:
+        with open(scores.database, 'rb') as filey:
+            tree = pickle.load(filey)
+        if not scores.check(tree):
+            return None
+    return (scores, tree._similarity_incidence(scores.tags, scores.weight))
+
+
+def _score_tile(outdir, index):
+    '''score one tile, and save it to the results. We write to a temporary
+       file first, so a result is either complete or missing.
+    '''
+    import numpy
+
+    outdir = os.path.abspath(outdir)
+    if outdir not in _workers:
+        _workers[outdir] = _worker_state(PairwiseScores(outdir))
+
+    if _workers[outdir] is None:
+        return None
+
+    scores, (incidence, weighted, totals) = _workers[outdir]
+    row_start, row_end, column_start, column_end = scores.tiles[index]
+    block = _similarity_block(incidence, weighted, totals,
+                              (row_start, row_end), (column_start, column_end))
+
+    result = scores._result(index)
+    with open(result + '.tmp', 'wb') as filey:
+        numpy.save(filey, block.astype(numpy.float32))
+    os.rename(result + '.tmp', result)
+    return index
+
+
+def _score_tile_worker(args):
+    return _score_tile(*args)
+
+
+def score_pairs(self, outdir, tags=None, weight=None, tile=1024, workers=1,
+                          run=True):
+    '''score all pairs of tags, split into tiles, with checkpoints in an
+       output folder. If the folder already has a plan, we resume it and
+       only score the tiles that aren't finished. The plan must be for the
+       same tree, tags, weight and tile, otherwise None is returned (use
+       another folder). If there is no plan, we write one (see PairwiseScores.plan).
+       The PairwiseScores is returned, to write batch jobs, check progress,
+       or merge the results.
+
+       Parameters
+       ==========
+       outdir: the output folder for the plan, database and results
+       tags: a list of tags to score (default is all tags)
+       weight: weight nodes by None (count), size, depth, or idf
+       tile: the number of tags (rows and columns) in each tile
+       workers: the number of processes to use
+       run: if False, only write the plan (e.g., to write batch jobs)
+    '''
+    if os.path.exists(os.path.join(outdir, 'plan.json')):
+        scores = PairwiseScores(outdir)
+
+        # The plan (and saved tree) must be for the same scores
+        if tags is None:
+            tags = sorted(self.root.tags)
+        requested = {'tags': list(tags), 'weight': weight, 'tile': tile}
+        changed = [key for key in sorted(requested)
+                   if getattr(scores, key) != requested[key]]
+        if scores.tree is not None and scores.tree != _tree_hash(self):
+            changed.append('tree')
+        if changed:
+            print('The plan in %s does not match (%s), use another folder.'
+                  % (outdir, ', '.join(changed)))
+            return None
+    else:
+        scores = PairwiseScores.plan(self, outdir, tags, weight, tile)
+        if scores is None:
+            return None
+
+    if run:
+        scores.run(workers=workers)
+    return scores
@@ -0,0 +1,146 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Node weights for similarity scores. By default every node (path component)
+# counts once, but a node can instead be weighted by file size, inverse depth,
+# or inverse document frequency (idf) across containers. The same weights are
+# used for one score (similarity_score) and for all pairs (similarity_matrix).
+
+from math import log
+
+_weights = [None, 'size', 'depth', 'idf']
+
+
+def _similarity_weight(self, node, weight=None, depth=0, count=None):
+    '''return the weight of a node for a similarity score, where depth is
+       the depth of the (first component of the) node, and count is the
+       number of tags in the tree (for idf). A compressed (radix) node
+       counts as each of its components (see _weigh).
+    '''
+    size = 0
+    if weight == 'size' and node.leaf and not node.children:
+        size = getattr(node, 'size', 0) or 0
+    return _weigh(weight, len(node.prefix) + 1, size, depth, count, len(node.tags))
+
+
+def _weigh(weight, components, size, depth, count, tags):
+    '''return the weight of a node with a number of path components, the
+       size of the file (0 for a folder) and the number of tags it has. A
+       FrozenTree weighs its nodes the same way.
+
+       None: each component counts 1
+       size: the size of a file (a leaf without children), folders are 0
+       depth: each component counts 1 / (depth + 1), the root counts 1
+       idf: each component counts log((1 + count) / (1 + tags)) + 1, so
+            paths in fewer containers count more
+    '''
+    if weight == 'size':
+        return size
+
+    if weight == 'depth':
+        return sum(1.0 / (depth + i + 1) for i in range(components))
+
+    if weight == 'idf':
+        return components * (log((1 + count) / float(1 + tags)) + 1)
+
+    return components
+
+
+def _check_weight(weight):
+    '''make sure a weight is known, and print the choices if not'''
+    if weight not in _weights:
+        print('%s is not a valid weight, choices are %s' % (weight, _weights))
+        return False
+    return True
+
+
+def _similarity_incidence(self, tags, weight=None):
+    '''return a sparse (csc) matrix of nodes by tags (1 if the tag is at
+       the node), the same matrix with each node (row) multiplied by its
+       weight, and the total weight for each tag. Any block of scores
+       can then be calculated with _similarity_block.
+    '''
+    from scipy import sparse
+    import numpy
+
+    columns = dict((tag, i) for i, tag in enumerate(tags))
+    count = len(self.root.tags)
+
+    rows = []
+    cols = []
+    weights = []
+
+    def traverse(node, depth):
+        found = [columns[t] for t in node.tags if t in columns]
+        if found:
+            rows.extend([len(weights)] * len(found))
+            cols.extend(found)
+            weights.append(self._similarity_weight(node, weight, depth, count))
+
+        for child in node.children:
+            traverse(child, depth + len(node.prefix) + 1)
+
+    traverse(self.root, 0)
+
+    incidence = sparse.csc_matrix((numpy.ones(len(rows)), (rows, cols)),
+                                  shape=(len(weights), len(tags)))
+    weighted = sparse.diags(numpy.array(weights, dtype=float)).dot(incidence)
+    weighted = sparse.csc_matrix(weighted)
+    totals = numpy.asarray(weighted.sum(axis=0)).ravel()
+    return incidence, weighted, totals
+
+
+def _similarity_block(incidence, weighted, totals, rows, columns):
+    '''calculate the scores for a block of tags, rows and columns are each
+       a (start, end) range of the tags. The memory is proportional to the
+       size of the block.
+    '''
+    import numpy
+
+    shared = incidence[:, rows[0]:rows[1]].T.dot(weighted[:, columns[0]:columns[1]])
+    shared = numpy.asarray(shared.todense())
+
+    # The total is the weight with either tag: both totals, minus shared
+    union = (totals[rows[0]:rows[1], None] +
+             totals[None, columns[0]:columns[1]] - shared)
+    scores = numpy.zeros_like(shared)
+    numpy.divide(shared, union, out=scores, where=union > 0)
+    return scores
+
+
+def similarity_matrix(self, tags=None, weight=None):
+    '''calculate the similarity score for all pairs of tags, in one pass over
+       the tree. We build a (sparse) matrix of nodes by tags, and multiply
+       it by its (weighted) transpose to get the shared weight for every
+       pair. A tuple of the scores (a numpy array) and the tags (the row
+       and column order) is returned. The score for two tags is the same
+       as similarity_score([tag1, tag2], weight=weight)['score'].
+
+       Parameters
+       ==========
+       tags: a list of tags to include (default is all tags in the tree)
+       weight: weight nodes by None (count), size, depth, or idf
+    '''
+    if not _check_weight(weight):
+        return None
+
+    if tags is None:
+        tags = sorted(self.root.tags)
+    tags = list(tags)
+
+    incidence, weighted, totals = self._similarity_incidence(tags, weight)
+    everything = (0, len(tags))
+    return _similarity_block(incidence, weighted, totals, everything, everything), tags
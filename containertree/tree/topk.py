@@ -0,0 +1,129 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Top-k (heavy hitter) queries for container trees, such as the largest
+# folders or files, or the paths shared by the most containers. We use a
+# best-first traversal with a heap, and prune with upper bounds for the
+# subtrees, so we don't need to visit (or export) the entire tree.
+
+from itertools import count
+import heapq
+
+
+def _subtree_size(node, tag=None):
+    '''the rollup size of a subtree, optionally for one tag'''
+    if tag is not None:
+        return node._du_tags.get(tag, 0)
+    return node._du_size
+
+
+def top_k(self, metric='size', k=10, tag=None):
+    '''return the top k paths for a metric, as a list of (value, path)
+       sorted from largest to smallest. The metrics are:
+
+       size: the folders with the largest total size (uses rollups)
+       file_size: the largest files (uses rollups for upper bounds)
+       tags: the leaves shared by the most tags (containers)
+       counter: the leaves with the largest counter
+
+       The first three give an upper bound for each subtree (the total size,
+       or the number of tags of the parent) so we visit the nodes best first,
+       and stop after k. The counter has no bound, so we keep a heap of
+       size k over all nodes.
+
+       Parameters
+       ==========
+       metric: one of size, file_size, tags, or counter
+       k: the number of paths to return
+       tag: if defined, only include nodes for the tag (container)
+    '''
+    if metric not in ['size', 'file_size', 'tags', 'counter']:
+        print('%s is not a valid metric for top_k.' % metric)
+        return None
+
+    if metric in ['size', 'file_size'] and not self._rollups:
+        if not hasattr(self, 'rollup'):
+            print('%s requires rollups, see ContainerFileTree.' % metric)
+            return None
+        self.rollup()
+
+    def children(node):
+        for child in node.children:
+            if tag is None or tag in child.tags:
+                yield child
+
+    def values(node, path):
+        '''yield (value, path) for each component of the node that counts
+           for the metric. All but the last component of a radix node are
+           folders, and share the totals (and tags) of the node.
+        '''
+        for link in node.get_chain():
+            path = path + self.folder_sep + link.label
+            last = link is node
+
+            if metric == 'size':
+                if not last or node.children:
+                    yield _subtree_size(node, tag), path
+
+            elif last and metric == 'file_size':
+                if node.leaf and not node.children:
+                    yield getattr(node, 'size', 0) or 0, path
+
+            elif last and node.leaf:
+                if metric == 'tags':
+                    yield len(node.tags), path
+                else:
+                    yield node.counter, path
+
+    def bound(node):
+        '''an upper bound for the values in the subtree of the node'''
+        if metric in ['size', 'file_size']:
+            return _subtree_size(node, tag)
+        return len(node.tags)
+
+    def join(node, path):
+        return self.folder_sep.join([path] + list(node.prefix) + [node.label])
+
+    # Counter: no bound, keep the k largest
+    if metric == 'counter':
+        def traverse(node, path):
+            for child in children(node):
+                for found in values(child, path):
+                    yield found
+                for found in traverse(child, join(child, path)):
+                    yield found
+
+        return heapq.nlargest(k, traverse(self.root, ''), key=lambda x: x[0])
+
+    # Otherwise, visit the largest upper bound first. Exact values are
+    # pushed back on the heap, and popped before any smaller bound.
+    found = []
+    order = count()
+    heap = [(-bound(self.root), next(order), False, self.root, '')]
+
+    while heap and len(found) < k:
+        key, _, exact, node, path = heapq.heappop(heap)
+
+        if exact:
+            found.append((-key, path))
+            continue
+
+        for child in children(node):
+            for child_value, child_path in values(child, path):
+                heapq.heappush(heap, (-child_value, next(order), True, None, child_path))
+            heapq.heappush(heap, (-bound(child), next(order), False, child, join(child, path)))
+
+    return found
@@ -35,3 +35,14 @@ from .docker import (
     parse_image_uri,
     DockerInspector
 )
+
+from .dockerfile import (
+    get_from,
+    load_pair,
+    load_pairs
+)
+
+from .versions import (
+    debian_version_key,
+    pep440_version_key
+)
@@ -17,6 +17,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 '''
 
+from collections import OrderedDict
 import json
 import math
 import os
@@ -52,9 +53,17 @@ _default_uri = re.compile("(?:(?P<registry>[^/@]+)/)?"
                           "(?:@(?P<version>.+))?"
                           "$")
 
+# Parsed uris by (image, default_tag, default_namespace), up to a size, with
+# the most recently used last
+_parsed_uris = OrderedDict()
+_parsed_uris_size = 4096
+
 def parse_image_uri(image, default_tag='latest', default_namespace='library'):
     '''parse the image uri and return a dictionary to look up namespace,
        tag, and registry. If the name doesn't match a pattern, we return None.
+       The same uris are parsed many times (e.g., parents in a collection
+       tree), so the results are cached (the most recently used), and
+       each call returns a copy.
 
        Parameters
        ==========
@@ -62,30 +71,69 @@ def parse_image_uri(image, default_tag='latest', default_namespace='library'):
        default_tag: the image tag (e.g., latest) default is latest
        default_namespace: the default collection (e.g., library)
     '''
+    key = (image, default_tag, default_namespace)
+    parsed = _parsed_uris.pop(key, None)
+    if parsed is None:
+        parsed = _parse_image_uri(image, default_tag, default_namespace)
+        if parsed is None:
+            return None
+
+        # When the cache is full, the least recently used uri is removed
+        if len(_parsed_uris) >= _parsed_uris_size:
+            _parsed_uris.popitem(last=False)
+
+    # A uri that is found is moved to the end (most recently used)
+    _parsed_uris[key] = parsed
+    return dict(parsed)
+
+
+def _split_image_uri(image):
+    '''split a uri of the most common form, [namespace/]repo[:tag], without
+       the regular expressions. We return the registry, namespace, repo,
+       tag and version (as the expressions would), or None for any other
+       form (e.g., with a registry, nested namespace, or version).
+    '''
+    if '@' in image:
+        return None
+
+    namespace, slash, repo = image.rpartition('/')
+    # A first component with . or : is a registry (e.g., localhost:5000)
+    if slash and (not namespace or any(c in namespace for c in '/.:')):
+        return None
+
+    repo, colon, tag = repo.partition(':')
+    if not repo or (colon and (not tag or ':' in tag)):
+        return None
 
-    # Match from docker to default
-    uri_regexes = [ _docker_uri,
-                    _reduced_uri,
-                    _default_uri ]
+    return (None, namespace or None, repo, tag or None, None)
 
-    for r in uri_regexes:
+
+def _match_image_uri(image):
+    '''match an image uri with the regular expressions, from docker to
+       default, and return the registry, namespace, repo, tag and version,
+       or None if none of them match.
+    '''
+    for r in [_docker_uri, _reduced_uri, _default_uri]:
         match = r.match(image)
         if match:
-            break
+            registry, namespace, repo, tag, version = match.group('registry',
+                                 'namespace', 'repo', 'tag', 'version')
+            if namespace:
+                namespace = namespace.rstrip('/')
+            return (registry, namespace or None, repo, tag, version)
+
 
-    if not match:
-        # Calling client should expect None to indicate not parseable
+def _parse_image_uri(image, default_tag='latest', default_namespace='library'):
+    '''parse an image uri (see parse_image_uri), without the cache'''
+
+    groups = _split_image_uri(image) or _match_image_uri(image)
+
+    # Calling client should expect None to indicate not parseable
+    if groups is None:
         print('Could not parse image %s' % image)
         return None
 
-    registry = match.group('registry')
-    namespace = match.group('namespace')
-    repo_name = match.group('repo')
-    repo_tag = match.group('tag')
-    version = match.group('version')
-
-    if namespace:
-        namespace = namespace.rstrip('/')
+    registry, namespace, repo_name, repo_tag, version = groups
 
     # replace empty fields with defaults
     if not namespace:
@@ -0,0 +1,130 @@
+'''
+
+Copyright (C) 2018-2019 Vanessa Sochat.
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import re
+from .docker import parse_image_uri
+
+################################################################################
+# Dockerfile Pairs: a container uri and the uri it's built FROM, either given
+# directly or read from the container's Dockerfile.
+################################################################################
+
+# FROM <image>, skipping any flags (e.g., --platform=linux/amd64)
+_from_line = re.compile(r'^\s*FROM\s+(?:--\S+\s+)*(?P<image>\S.*?)\s*$', re.IGNORECASE)
+
+# Environment variables (and similar) in a uri, and invalid endings
+_uri_literals = re.compile('[$}{\'"]')
+_uri_ending = re.compile('-$')
+
+
+def get_from(dockerfile):
+    '''return the (first) FROM line of a Dockerfile, without FROM, or None if
+       the Dockerfile doesn't have one (or can't be read). We stop reading
+       at the first FROM.
+
+       Parameters
+       ==========
+       dockerfile: the path to the Dockerfile
+    '''
+    try:
+        with open(dockerfile, 'r') as filey:
+            for line in filey:
+                match = _from_line.match(line)
+                if match:
+                    return match.group('image')
+    except (IOError, OSError, UnicodeDecodeError):
+        pass
+
+
+def load_pair(uri, fromuri):
+    '''return an (image, parent) pair for a container uri and a fromuri, or
+       None if the pair isn't valid. The fromuri can be a Dockerfile for the
+       uri, and then the parent is read from the FROM, and both uris are
+       validated: multi-stage (AS) builds, uppercase or invalid endings,
+       and variables (e.g., FROM $BASE) aren't allowed.
+
+       Parameters
+       ==========
+       uri: the container uri
+       fromuri: the uri of the parent, or the container's Dockerfile
+    '''
+    # It's not valid to have a Dockerfile as the image uri
+    if "Dockerfile" in uri and os.path.exists(uri):
+        return None
+
+    # A parent uri is used as is
+    if "Dockerfile" not in fromuri:
+        return (uri, fromuri)
+
+    fromuri = get_from(fromuri)
+    if not fromuri:
+        return None
+
+    # We can't use any AS statements
+    if " as " in fromuri.lower():
+        return None
+
+    # Remove any extra comments, etc. next to FROM <container>
+    fromuri = fromuri.split(' ')[0]
+
+    for image in [uri, fromuri]:
+        if image.isupper() or _uri_ending.search(image):
+            return None
+
+        # Don't allow environment vars or similar
+        if _uri_literals.search(image):
+            return None
+
+        if not parse_image_uri(image):
+            return None
+
+    return (uri, fromuri)
+
+
+def _load_pair_worker(pair):
+    return load_pair(*pair)
+
+
+def load_pairs(pairs, workers=1, chunksize=None):
+    '''load a list of (uri, fromuri) pairs with load_pair, in this process
+       or a pool of worker processes, and return the (image, parent) pairs,
+       in the same order. A pair that isn't valid is None.
+
+       Parameters
+       ==========
+       pairs: a list of (uri, fromuri) pairs, where fromuri can be a Dockerfile
+       workers: the number of processes to use
+       chunksize: the number of pairs to send to a worker at once
+    '''
+    pairs = [tuple(pair) for pair in pairs]
+
+    if workers <= 1 or len(pairs) <= 1:
+        return [load_pair(uri, fromuri) for uri, fromuri in pairs]
+
+    if chunksize is None:
+        chunksize = max(1, len(pairs) // (workers * 4))
+
+    from multiprocessing import Pool
+    pool = Pool(workers)
+    try:
+        return pool.map(_load_pair_worker, pairs, chunksize)
+    finally:
+        pool.close()
+        pool.join()
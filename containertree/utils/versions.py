@@ -0,0 +1,144 @@
+'''
+
+Copyright (C) 2018-2019 Vanessa Sochat.
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import re
+
+################################################################################
+# Version Keys: parse a version string once into a key that sorts the same
+# way that the package manager compares versions.
+################################################################################
+
+_debian_parts = re.compile('([^0-9]*)([0-9]*)')
+
+# The order of Debian characters: ~ before anything (even the end), then
+# letters, then all other characters
+def _debian_order(char):
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _debian_string_key(part):
+    '''return the key for one version part (upstream or revision) as a
+       tuple of (non-digit, digit) pairs. The non-digit strings end with 0,
+       so the end of a string sorts after ~ but before anything else.
+    '''
+    pairs = []
+    for letters, digits in _debian_parts.findall(part):
+        if not letters and not digits:
+            continue
+        letters = tuple(_debian_order(c) for c in letters) + (0,)
+        pairs.append((letters, int(digits or 0)))
+
+    # An empty string and 0 are the same, and the end compares as both
+    while pairs and pairs[-1] == ((0,), 0):
+        pairs.pop()
+    return tuple(pairs) + (((0,), 0),)
+
+
+def debian_version_key(version):
+    '''return a key to sort Debian (apt) versions, [epoch:]upstream[-revision]
+       following the ordering used by dpkg --compare-versions.
+
+       Parameters
+       ==========
+       version: the version string, e.g., 1:1.2.8.dfsg-5
+    '''
+    epoch = 0
+    if ':' in version:
+        prefix, rest = version.split(':', 1)
+        if prefix.isdigit():
+            epoch, version = int(prefix), rest
+
+    revision = ''
+    if '-' in version:
+        version, revision = version.rsplit('-', 1)
+
+    return (epoch,
+            _debian_string_key(version),
+            _debian_string_key(revision))
+
+
+_pep440 = re.compile(r'''
+    ^\s*v?
+    (?:(?P<epoch>[0-9]+)!)?
+    (?P<release>[0-9]+(?:\.[0-9]+)*)
+    (?:[-_\.]?(?P<pre_l>a|b|c|rc|alpha|beta|pre|preview)[-_\.]?(?P<pre_n>[0-9]+)?)?
+    (?:(?:-(?P<post_n1>[0-9]+))|(?:[-_\.]?(?P<post_l>post|rev|r)[-_\.]?(?P<post_n2>[0-9]+)?))?
+    (?:[-_\.]?(?P<dev_l>dev)[-_\.]?(?P<dev_n>[0-9]+)?)?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_\.][a-z0-9]+)*))?
+    \s*$''', re.VERBOSE | re.IGNORECASE)
+
+_pep440_pre = {'a': 0, 'alpha': 0, 'b': 1, 'beta': 1,
+               'c': 2, 'rc': 2, 'pre': 2, 'preview': 2}
+
+# Parts that are missing sort before (-1) or after (1) any value (0, value)
+_before = (-1,)
+_after = (1,)
+
+
+def pep440_version_key(version):
+    '''return a key to sort Python (pip) versions following PEP 440. A
+       version that doesn't follow PEP 440 sorts before all that do (like
+       a legacy version) and these are compared as strings.
+
+       Parameters
+       ==========
+       version: the version string, e.g., 1.0.post1 or 2.0rc1
+    '''
+    match = _pep440.match(version)
+    if match is None:
+        return (0, version)
+
+    # Trailing zeros in the release don't matter, 1.0 == 1
+    release = [int(x) for x in match.group('release').split('.')]
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+
+    dev = _after
+    if match.group('dev_l'):
+        dev = (0, int(match.group('dev_n') or 0))
+
+    post = _before
+    if match.group('post_n1') or match.group('post_l'):
+        post = (0, int(match.group('post_n1') or match.group('post_n2') or 0))
+
+    # A development release (without pre or post) is before a pre-release
+    pre = _after
+    if match.group('pre_l'):
+        pre = (0, _pep440_pre[match.group('pre_l').lower()],
+                  int(match.group('pre_n') or 0))
+    elif post == _before and dev != _after:
+        pre = _before
+
+    # Local segments: numbers sort after strings
+    local = _before
+    if match.group('local'):
+        local = []
+        for part in re.split('[-_.]', match.group('local').lower()):
+            if part.isdigit():
+                local.append((1, int(part), ''))
+            else:
+                local.append((0, 0, part))
+        local = (0, tuple(local))
+
+    return (1, int(match.group('epoch') or 0), tuple(release),
+            pre, post, dev, local)
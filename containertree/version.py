@@ -14,7 +14,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-__version__ = "0.0.49"
+__version__ = "0.0.92"
 AUTHOR = 'Vanessa Sochat'
 AUTHOR_EMAIL = 'vsochat@stanford.edu'
 NAME = 'containertree'
@@ -35,6 +35,8 @@ INSTALL_REQUIRES = (
 
 INSTALL_ANALYSIS = (
     ('pandas', {'min_version': None}),
+    ('numpy', {'min_version': None}),
+    ('scipy', {'min_version': None}),
 )
 
 INSTALL_REQUIRES_ALL = (INSTALL_REQUIRES + INSTALL_ANALYSIS)
@@ -0,0 +1,77 @@
+#
+# Copyright (C) 2018-2019 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from containertree.utils.docker import ( parse_image_uri,
+                                         _parse_image_uri,
+                                         _parsed_uris,
+                                         _match_image_uri,
+                                         _split_image_uri )
+import pickle
+import timeit
+import re
+import os
+
+################################################################################
+# Image uris
+################################################################################
+
+# The containers (and the uris they are built from) in the Dockerfiles that
+# are saved here, each parsed as many times as a collection tree would (a
+# parent is parsed once for each of its children).
+
+here = os.path.dirname(os.path.abspath(__file__))
+dockerfiles = pickle.load(open(os.path.join(here, 'dockerfiles-02-16-2017.pkl'), 'rb'))
+
+uris = []
+for uri, dockerfile in dockerfiles.items():
+    uris.append(uri)
+    match = re.search(r'^\s*FROM\s+(\S+)', dockerfile, re.MULTILINE | re.IGNORECASE)
+    if match:
+        uris.append(match.group(1))
+
+fast = [uri for uri in uris if _split_image_uri(uri) is not None]
+print('%s uris (%s unique), %s with the fast path' % (len(uris), len(set(uris)), len(fast)))
+
+
+################################################################################
+# Benchmark
+################################################################################
+
+def regexes():
+    for uri in uris:
+        _match_image_uri(uri)
+
+def split():
+    for uri in uris:
+        _split_image_uri(uri) or _match_image_uri(uri)
+
+def uncached():
+    for uri in uris:
+        _parse_image_uri(uri)
+
+def cached():
+    for uri in uris:
+        parse_image_uri(uri)
+
+repeat = 50
+for name, func in [('regular expressions', regexes),
+                   ('fast path, then expressions', split),
+                   ('parse_image_uri (no cache)', uncached),
+                   ('parse_image_uri', cached)]:
+    seconds = min(timeit.repeat(func, number=repeat, repeat=3)) / repeat
+    print('%-30s %8.1f us per uri' % (name, seconds / len(uris) * 1e6))
+
+print('%s uris in the cache' % len(_parsed_uris))
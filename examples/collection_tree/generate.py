@@ -57,28 +57,17 @@ if os.path.exists('container-collection-tree-final.pkl'):
 else:
     tree = CollectionTree()
 
-    # First addition will only add library containers to root
-    for pair in pairs:
-        tree.update(uri=pair[0], fromuri=pair[1])
-
-    # We skip over containers with variables in name (eg., FROM $BASE) and
-    # parse away as build, etc.
-
-    # Save intermediate tree
-    pickle.dump(tree, open('container-collection-tree-library-only.pkl','wb'))
+    # Add all pairs in one pass, each container after its parent. We skip
+    # over containers with variables in name (eg., FROM $BASE) and parse
+    # away as build, etc. (invalid), and containers without a path to a
+    # library container (orphans). Only reading the FROM of the Dockerfiles
+    # uses the 8 processes, the tree is built in this one.
+    report = tree.build(pairs, workers=8)
+    print('Added %s containers, skipped %s invalid and %s orphans.'
+          % (report['added'], len(report['invalid']), len(report['orphans'])))
 
     len(tree.root.children)
     # 177
 
-    # Now add nodes onto library
-    for pair in pairs:
-        tree.update(uri=pair[0], fromuri=pair[1])
-
-    pickle.dump(tree, open('container-collection-tree.pkl','wb'))
-
-
-    for pair in pairs:
-        tree.update(uri=pair[0], fromuri=pair[1])
-
     # Save final tree
     pickle.dump(tree, open('container-collection-tree-final.pkl','wb'))
@@ -42,6 +42,5 @@ else:
 
 print('Creating paths...')
 
-for path in tree.paths(leaves_only=True, tag_prefix='tag-'):
-    if not os.path.exists(path):
-        os.makedirs(path)
+# Each folder (e.g., /scratch/library/debian) is created once
+tree.materialize('/', tag_prefix='tag-')
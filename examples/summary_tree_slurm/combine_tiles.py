@@ -0,0 +1,27 @@
+#/usr/bin/env python
+
+# Merge the finished tiles of scores into a tiled heatmap (tiles/heatmap)
+# One block of rows is in memory at once, and the heatmap-tiles template
+# (index.html) loads the tiles for the rows in view.
+
+from containertree.tree import PairwiseScores
+import pickle
+import sys
+import os
+
+here = os.getcwd()
+scores = PairwiseScores('%s/tiles' % here)
+
+# The tiles must be scored from this database, plan again if it changed
+tree = pickle.load(open(scores.database, 'rb'))
+if not scores.check(tree):
+    sys.exit(1)
+
+# Jobs that failed can be submitted again, finished tiles are skipped
+pending = scores.pending()
+if pending:
+    print('%s tiles are pending, submit their jobs again.' % len(pending))
+
+else:
+    manifest = scores.merge()
+    print('Serve %s to view the heatmap.' % os.path.dirname(manifest))
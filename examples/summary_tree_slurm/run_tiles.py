@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2018 Vanessa Sochat.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# This script plans the all-vs-all scores for the containers in the tree, in
+# tiles, and writes a SLURM job for each group of tiles (see run_jobs.sh)
+
+import pickle
+import sys
+import os
+
+database = 'database.pkl'
+if not os.path.exists(database):
+    print('Database not found at %s' %database)
+    sys.exit(1)
+
+print('Loading Saved Container Tree:')
+tree = pickle.load(open(database, 'rb'))
+
+here = os.getcwd()
+containers = list(tree.root.tags)
+print('%s of containers are found in tree!' %len(containers)) 
+
+# Write the plan (no scoring yet) to tiles, and the jobs to tiles/jobs
+scores = tree.score_pairs('%s/tiles' % here, tile=256, run=False)
+if scores is None:
+    sys.exit(1)
+
+scores.write_jobs(jobs=200, header=['#SBATCH --job-name={name}',
+                                    '#SBATCH --output={jobs}/{name}.out',
+                                    '#SBATCH --error={jobs}/{name}.err',
+                                    '#SBATCH --time=60:00',
+                                    '#SBATCH --mem=8000',
+                                    '#SBATCH -p russpold',
+                                    'ml python/3.6.1'])
+
+print('Submit the jobs with: bash tiles/jobs/run_jobs.sh')